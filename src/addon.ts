@@ -9,9 +9,10 @@ import { KitsuProvider } from './providers/kitsu';
 import { formatMediaFlowUrl } from './utils/mediaflow';
 import { AnimeUnityConfig } from "./types/animeunity";
 import { EPGManager } from './utils/epg';
-import { execFile } from 'child_process';
+import { execFile, spawn } from 'child_process';
+import * as readline from 'readline';
+import { PythonSidecar, SidecarUnavailableError } from './utils/pythonSidecar';
 import * as crypto from 'crypto';
-import * as util from 'util';
 
 // Funzioni utility per decodifica base64
 function decodeBase64(str: string): string {
@@ -40,9 +41,6 @@ function decodeStaticUrl(url: string): string {
     return url;
 }
 
-// Promisify execFile
-const execFilePromise = util.promisify(execFile);
-
 // Interfaccia per la configurazione URL
 interface AddonConfig {
   mediaFlowProxyUrl?: string;
@@ -328,6 +326,11 @@ const vavooCache: VavooCache = {
     updating: false
 };
 
+// Processo Python persistente per le risoluzioni Vavoo (disattivabile con PYTHON_SIDECAR=false)
+const vavooSidecar = process.env.PYTHON_SIDECAR === 'false'
+    ? null
+    : new PythonSidecar(path.join(__dirname, '../vavoo_resolver.py'), ['--serve'], 'Vavoo');
+
 // Path del file di cache per Vavoo
 const vavaoCachePath = path.join(__dirname, '../cache/vavoo_cache.json');
 
@@ -391,6 +394,47 @@ function saveVavooCache(): void {
     }
 }
 
+// Legge il dump NDJSON dei canali Vavoo riga per riga, senza bufferizzare l'intero output
+function streamVavooChannels(onChannel: (channel: any) => void, timeoutMs: number): Promise<number> {
+    return new Promise((resolve, reject) => {
+        const child = spawn('python3', [
+            path.join(__dirname, '../vavoo_resolver.py'),
+            '--dump-channels',
+            '--ndjson'
+        ]);
+        let count = 0;
+        let stderrTail = '';
+        const timer = setTimeout(() => {
+            child.kill();
+            reject(new Error(`Timeout dopo ${timeoutMs}ms (${count} canali ricevuti)`));
+        }, timeoutMs);
+
+        readline.createInterface({ input: child.stdout }).on('line', (line: string) => {
+            if (!line.trim()) return;
+            try {
+                onChannel(JSON.parse(line));
+                count++;
+            } catch (jsonError) {
+                console.error('❌ Riga JSON Vavoo non valida:', line.substring(0, 100));
+            }
+        });
+        child.stderr.on('data', (data: Buffer) => {
+            stderrTail = (stderrTail + data.toString()).slice(-2000);
+        });
+        child.on('error', (err: Error) => {
+            clearTimeout(timer);
+            reject(err);
+        });
+        child.on('close', (code: number | null) => {
+            clearTimeout(timer);
+            if (code !== 0) {
+                return reject(new Error(`vavoo_resolver.py terminato con codice ${code}: ${stderrTail}`));
+            }
+            resolve(count);
+        });
+    });
+}
+
 // Funzione per aggiornare la cache Vavoo
 async function updateVavooCache(): Promise<boolean> {
     if (vavooCache.updating) {
@@ -402,30 +446,27 @@ async function updateVavooCache(): Promise<boolean> {
     console.log(`📺 Avvio aggiornamento cache Vavoo...`);
     try {
         // PATCH: Prendi TUTTI i canali da Vavoo, senza filtri su tv_channels.json
-        const result = await execFilePromise('python3', [
-            path.join(__dirname, '../vavoo_resolver.py'),
-            '--dump-channels'
-        ], { timeout: 30000 });
+        // Il dump è NDJSON: ogni canale entra in cache appena arriva, senza attendere l'intero catalogo
+        const seenNames = new Set<string>();
+        const received = await streamVavooChannels((ch: any) => {
+            if (ch.name && ch.url) {
+                vavooCache.links.set(ch.name, ch.url);
+                seenNames.add(ch.name);
+            }
+        }, 30000);
 
-        if (result.stdout) {
-            try {
-                const channels = JSON.parse(result.stdout);
-                console.log(`📺 Recuperati ${channels.length} canali da Vavoo (nessun filtro)`);
-                const updatedLinks = new Map<string, string>();
-                for (const ch of channels) {
-                    if (ch.name && ch.url) {
-                        updatedLinks.set(ch.name, ch.url);
-                    }
+        if (received > 0) {
+            console.log(`📺 Recuperati ${received} canali da Vavoo (nessun filtro)`);
+            // Rimuovi i canali che non sono più nel catalogo
+            for (const name of Array.from(vavooCache.links.keys())) {
+                if (!seenNames.has(name)) {
+                    vavooCache.links.delete(name);
                 }
-                vavooCache.links = updatedLinks;
-                vavooCache.timestamp = Date.now();
-                saveVavooCache();
-                console.log(`✅ Cache Vavoo aggiornata: ${updatedLinks.size} canali in cache (tutti)`);
-                return true;
-            } catch (jsonError) {
-                console.error('❌ Errore nel parsing del risultato JSON di Vavoo:', jsonError);
-                throw jsonError;
             }
+            vavooCache.timestamp = Date.now();
+            saveVavooCache();
+            console.log(`✅ Cache Vavoo aggiornata: ${vavooCache.links.size} canali in cache (tutti)`);
+            return true;
         }
     } catch (error) {
         console.error('❌ Errore durante l\'aggiornamento della cache Vavoo:', error);
@@ -594,44 +635,82 @@ function resolveVavooChannelByName(channelName: string): Promise<string | null>
         
         // Se la cache non è ancora stata inizializzata, chiama lo script Python come fallback
         console.log(`[Vavoo] Cache non inizializzata, chiamo script Python per ${channelName}`);
+        // Dopo il timeout il chiamante ha già ricevuto null: nessun nuovo tentativo va avviato
+        let settled = false;
         const timeout = setTimeout(() => {
+            settled = true;
             console.log(`[Vavoo] Timeout per canale: ${channelName}`);
             resolve(null);
         }, 5000);
 
-        const options = {
-            timeout: 5000,
-            env: {
-                ...process.env,
-                PYTHONPATH: '/usr/local/lib/python3.9/site-packages'
-            }
-        };
-        
-        execFile('python3', [path.join(__dirname, '../vavoo_resolver.py'), channelName, '--original-link'], options, (error: Error | null, stdout: string, stderr: string) => {
+        const onResolved = (result: string) => {
             clearTimeout(timeout);
-            
-            if (error) {
-                console.error(`[Vavoo] Error for ${channelName}:`, error.message);
-                if (stderr) console.error(`[Vavoo] Stderr:`, stderr);
-                return resolve(null);
-            }
-            
-            if (!stdout || stdout.trim() === '') {
-                console.log(`[Vavoo] No output for ${channelName}`);
-                return resolve(null);
-            }
-            
-            const result = stdout.trim();
             console.log(`[Vavoo] Resolved ${channelName} to: ${result.substring(0, 50)}...`);
             
             // Aggiorna la cache con questo risultato
             vavooCache.links.set(channelName, result);
             
             resolve(result);
+        };
+
+        // Prima prova il processo Python persistente, poi ripiega su execFile
+        if (vavooSidecar) {
+            vavooSidecar.request([channelName, '--original-link'], 5000).then(response => {
+                if (response.ok && response.output) {
+                    return onResolved(String(response.output).trim());
+                }
+                console.log(`[Vavoo] Sidecar: ${response.error || 'nessun output'} per ${channelName}`);
+                clearTimeout(timeout);
+                resolve(null);
+            }).catch(error => {
+                // Ripiega su execFile solo se il sidecar non è disponibile, non dopo un timeout
+                if (!(error instanceof SidecarUnavailableError) || settled) {
+                    console.log(`[Vavoo] Sidecar: ${error.message} per ${channelName}`);
+                    clearTimeout(timeout);
+                    return resolve(null);
+                }
+                console.warn(`[Vavoo] Sidecar non disponibile, uso execFile:`, error.message);
+                resolveVavooWithProcess(channelName, onResolved, () => {
+                    clearTimeout(timeout);
+                    resolve(null);
+                });
+            });
+            return;
+        }
+
+        resolveVavooWithProcess(channelName, onResolved, () => {
+            clearTimeout(timeout);
+            resolve(null);
         });
     });
 }
 
+// Risolve un canale avviando un processo Python dedicato (fallback del sidecar)
+function resolveVavooWithProcess(channelName: string, onResolved: (result: string) => void, onFailure: () => void): void {
+    const options = {
+        timeout: 5000,
+        env: {
+            ...process.env,
+            PYTHONPATH: '/usr/local/lib/python3.9/site-packages'
+        }
+    };
+    
+    execFile('python3', [path.join(__dirname, '../vavoo_resolver.py'), channelName, '--original-link'], options, (error: Error | null, stdout: string, stderr: string) => {
+        if (error) {
+            console.error(`[Vavoo] Error for ${channelName}:`, error.message);
+            if (stderr) console.error(`[Vavoo] Stderr:`, stderr);
+            return onFailure();
+        }
+        
+        if (!stdout || stdout.trim() === '') {
+            console.log(`[Vavoo] No output for ${channelName}`);
+            return onFailure();
+        }
+        
+        onResolved(stdout.trim());
+    });
+}
+
 function normalizeProxyUrl(url: string): string {
     return url.endsWith('/') ? url.slice(0, -1) : url;
 }
@@ -1,9 +1,15 @@
 import { spawn } from 'child_process';
 import { AnimeSaturnConfig, AnimeSaturnResult, AnimeSaturnEpisode, StreamForStremio } from '../types/animeunity';
 import * as path from 'path';
+import { PythonSidecar, SidecarUnavailableError } from '../utils/pythonSidecar';
 import axios from 'axios';
 import { KitsuProvider } from './kitsu';
 
+// Processo Python persistente condiviso da tutte le richieste (disattivabile con PYTHON_SIDECAR=false)
+const sidecar = process.env.PYTHON_SIDECAR === 'false'
+    ? null
+    : new PythonSidecar(path.join(__dirname, 'animesaturn.py'), ['serve'], 'AnimeSaturn');
+
 // Helper function to invoke the Python scraper
 async function invokePythonScraper(args: string[]): Promise<any> {
     const scriptPath = path.join(__dirname, 'animesaturn.py');
@@ -26,6 +32,26 @@ async function invokePythonScraper(args: string[]): Promise<any> {
         args.push('--mfp-proxy-password', mfpProxyPassword);
     }
     
+    if (sidecar) {
+        let response;
+        try {
+            response = await sidecar.request(args);
+        } catch (err) {
+            // Un timeout non va ripetuto: il sidecar sta ancora eseguendo la stessa richiesta
+            if (!(err instanceof SidecarUnavailableError)) {
+                throw err;
+            }
+            // Sidecar non disponibile: ripiega sul processo singolo
+            console.warn('Python sidecar unavailable, falling back to spawn:', err.message);
+        }
+        if (response) {
+            if (!response.ok) {
+                throw new Error(`Python script error: ${response.error}`);
+            }
+            return response.result;
+        }
+    }
+
     return new Promise((resolve, reject) => {
         const pythonProcess = spawn(command, [scriptPath, ...args]);
         let stdout = '';
@@ -6,220 +6,570 @@ Estrae il link MP4 diretto dagli episodi di animesaturn.cx
 Dipendenze: requests, beautifulsoup4 (pip install requests beautifulsoup4)
 """
 
-import requests
-from bs4 import BeautifulSoup
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import re
 import sys
 import json
 import urllib.parse
 import argparse
 import os
-with open(os.path.join(os.path.dirname(__file__), '../../config/domains.json'), encoding='utf-8') as f:
-    DOMAINS = json.load(f)
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+
+# Costo (ms) delle fasi di avvio e degli import pesanti, mostrato da --profile-startup
+STARTUP_PROFILE = {}
+
+# --- Helper comuni: identici in vavoo_resolver.py, animeunity_scraper.py e animesaturn.py.
+# La build copia ogni script da solo in dist/, quindi nessuno dei tre può importare un modulo condiviso:
+# una modifica qui va riportata anche negli altri due. ---
+
+def _timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    STARTUP_PROFILE[label] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+def startup_report():
+    """Tempi di avvio: inizializzazione del modulo e import/caricamenti effettivamente eseguiti"""
+    heavy = ("requests", "urllib3", "bs4", "charset_normalizer", "idna", "certifi")
+    return {
+        "phases_ms": STARTUP_PROFILE,
+        "heavy_modules_loaded": sorted(name for name in heavy if name in sys.modules),
+        "total_ms": round((time.perf_counter() - _STARTUP_T0) * 1000, 2),
+    }
+
+def handle_profile_startup(load_heavy_modules):
+    """
+    --profile-startup da solo carica tutti i moduli pesanti (load_heavy_modules) e stampa il report;
+    insieme a un comando riporta su stderr, all'uscita, cosa ha caricato quel comando
+    """
+    if "--profile-startup" not in sys.argv:
+        return
+    sys.argv.remove("--profile-startup")
+    STARTUP_PROFILE["module init"] = round((time.perf_counter() - _STARTUP_T0) * 1000, 2)
+    if len(sys.argv) == 1:
+        load_heavy_modules()
+        print(json.dumps(startup_report(), indent=2))
+        sys.exit(0)
+    import atexit
+    atexit.register(lambda: print(f"[STARTUP] {json.dumps(startup_report())}", file=sys.stderr))
+
+def read_json_file(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """Scrive su un file temporaneo e poi rinomina, così chi legge non vede mai un file a metà"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+    os.replace(tmp_path, path)
+
+# --- Fine helper comuni ---
+
+def _load_domains():
+    with open(os.path.join(os.path.dirname(__file__), '../../config/domains.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+DOMAINS = _timed("config/domains.json", _load_domains)
 BASE_URL = f"https://{DOMAINS['animesaturn']}"
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
 HEADERS = {"User-Agent": USER_AGENT}
 TIMEOUT = 20
 
+# requests e bs4 vengono importati solo quando servono davvero (prima richiesta di rete / primo parsing HTML)
+_session = None
+_session_lock = threading.Lock()
+_soup_class = None
+
+def get_session():
+    """Sessione HTTP condivisa: in modalità serve le connessioni TLS restano aperte tra le richieste"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            requests = _timed("import requests", lambda: importlib.import_module("requests"))
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            _session = requests.Session()
+        return _session
+
+def _soup(markup, only=None):
+    """DOM di bs4; con only (lista di tag) vengono costruiti solo quei tag e il loro contenuto"""
+    global _soup_class
+    if _soup_class is None:
+        _soup_class = _timed("import bs4", lambda: importlib.import_module("bs4")).BeautifulSoup
+    if only:
+        from bs4 import SoupStrainer
+        return _soup_class(markup, "html.parser", parse_only=SoupStrainer(only))
+    return _soup_class(markup, "html.parser")
+
+# Directory per i file di cache condivisi tra le invocazioni (come config/, nella root del progetto)
+CACHE_DIR = os.environ.get("ANIMESATURN_CACHE_DIR", os.path.join(os.path.dirname(__file__), '../../cache'))
+
+# Indice MAL ID -> pagine AnimeSaturn, riempito da ogni pagina anime visitata durante le ricerche.
+# "pages": url -> MAL ID letto sulla pagina; "searches": MAL ID -> url trovati dall'ultima ricerca completa
+MAL_INDEX_FILE = os.path.join(CACHE_DIR, "animesaturn_mal_index.json")
+# Dopo questo tempo una ricerca viene rifatta (nuove versioni ITA/CR), riusando comunque le pagine già note
+MAL_INDEX_TTL = int(os.environ.get("ANIMESATURN_MAL_INDEX_TTL", str(7 * 86400)))
+# Ricerche senza risultati e pagine senza link MAL scadono prima
+MAL_INDEX_NEGATIVE_TTL = int(os.environ.get("ANIMESATURN_MAL_INDEX_NEGATIVE_TTL", str(6 * 3600)))
+# Primo link (href) verso la scheda MyAnimeList, come il bottone cercato prima con bs4.
+# Si applica ai byte man mano che arrivano: il resto della pagina non viene scaricato né decodificato
+MAL_LINK_RE = re.compile(rb"""<a\s[^>]*href\s*=\s*["'][^"']*myanimelist\.net/anime/(\d+)""", re.IGNORECASE)
+# Coda del blocco precedente mantenuta per i link a cavallo tra due blocchi
+MAL_SCAN_OVERLAP = 4096
+
+_mal_index = None
+_mal_index_lock = threading.Lock()
+
+def _load_mal_index():
+    global _mal_index
+    with _mal_index_lock:
+        if _mal_index is None:
+            data = read_json_file(MAL_INDEX_FILE)
+            if not isinstance(data, dict):
+                data = {}
+            _mal_index = {"pages": data.get("pages", {}), "searches": data.get("searches", {})}
+        return _mal_index
+
+def save_mal_index():
+    index = _load_mal_index()
+    with _mal_index_lock:
+        # Unisce con quanto scritto nel frattempo da altri processi
+        on_disk = read_json_file(MAL_INDEX_FILE) or {}
+        for section in ("pages", "searches"):
+            merged = dict(on_disk.get(section, {}))
+            merged.update(index[section])
+            index[section] = merged
+        try:
+            write_json_atomic(MAL_INDEX_FILE, index)
+        except OSError as e:
+            print(f"[DEBUG] Impossibile salvare l'indice MAL: {e}", file=sys.stderr)
+
+def record_page_mal_id(url, title, mal_id):
+    index = _load_mal_index()
+    with _mal_index_lock:
+        index["pages"][url] = {"mal_id": mal_id, "title": title, "checked_at": time.time()}
+
+def _scan_mal_link(resp, cancel=None):
+    """(MAL ID o None, pagina letta fino in fondo o al link); si ferma al primo link trovato"""
+    buffer = b""
+    for chunk in resp.iter_content(chunk_size=16384):
+        if cancel is not None and cancel.is_set():
+            return None, False
+        buffer += chunk
+        match = MAL_LINK_RE.search(buffer)
+        if match:
+            return match.group(1).decode("ascii"), True
+        buffer = buffer[-MAL_SCAN_OVERLAP:]
+    return None, True
+
+def page_mal_id(item, cancel=None):
+    """MAL ID della pagina anime (dall'indice se già visitata, altrimenti scaricandola e registrandola)"""
+    entry = _load_mal_index()["pages"].get(item["url"])
+    if entry and (entry.get("mal_id") or time.time() - entry.get("checked_at", 0) < MAL_INDEX_NEGATIVE_TTL):
+        return entry.get("mal_id")
+    if cancel is not None and cancel.is_set():
+        return None
+    with get_session().get(item["url"], headers=HEADERS, timeout=TIMEOUT, stream=True) as resp:
+        resp.raise_for_status()
+        found_id, complete = _scan_mal_link(resp, cancel)
+    # Una lettura interrotta non dice nulla sulla pagina: niente voce nell'indice
+    if complete:
+        record_page_mal_id(item["url"], item.get("title"), found_id)
+    return found_id
+
+# Visite concorrenti delle pagine candidate durante la ricerca per MAL ID
+CANDIDATE_WORKERS = int(os.environ.get("ANIMESATURN_CANDIDATE_WORKERS", "6"))
+
+def iter_candidate_mal_ids(items):
+    """
+    Scarica in parallelo le pagine candidate e restituisce (item, MAL ID, errore) nell'ordine di items.
+    Chiudere il generatore (uscita anticipata) annulla le visite in coda e interrompe quelle in corso.
+    """
+    if not items:
+        return
+    cancel = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=min(CANDIDATE_WORKERS, len(items)))
+    try:
+        futures = [pool.submit(page_mal_id, item, cancel) for item in items]
+        for item, future in zip(items, futures):
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
+    finally:
+        cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def variant_of(title):
+    """Versione AnimeSaturn dal titolo: normale, ITA o CR"""
+    t_upper = title.upper()
+    if '(ITA' in t_upper:
+        return "ita"
+    if '(CR' in t_upper:
+        return "cr"
+    return "normal"
+
+def mal_index_lookup(mal_id):
+    """Risultati dell'ultima ricerca completa per il MAL ID, o None se assente o scaduta"""
+    index = _load_mal_index()
+    search = index["searches"].get(str(mal_id))
+    if not search:
+        return None
+    ttl = MAL_INDEX_TTL if search.get("urls") else MAL_INDEX_NEGATIVE_TTL
+    if time.time() - search.get("at", 0) >= ttl:
+        return None
+    pages = index["pages"]
+    return [{"title": pages.get(url, {}).get("title") or "", "url": url} for url in search["urls"]]
+
+def record_mal_search(mal_id, matches):
+    index = _load_mal_index()
+    with _mal_index_lock:
+        index["searches"][str(mal_id)] = {"at": time.time(), "urls": [m["url"] for m in matches]}
+    save_mal_index()
+
 def safe_ascii_header(value):
     # Remove or replace non-latin-1 characters (e.g., typographic apostrophes)
     return value.encode('latin-1', 'ignore').decode('latin-1')
 
+# Pagine di ricerca richieste in anticipo rispetto a quella in lettura
+SEARCH_LOOKAHEAD = int(os.environ.get("ANIMESATURN_SEARCH_LOOKAHEAD", "2"))
+
+def _iter_pages_speculative(fetch_page, last_page=None, lookahead=None):
+    """
+    Restituisce (pagina, risultato di fetch_page) in ordine, tenendo già in volo le `lookahead` pagine successive.
+    Il chiamante interrompe l'iterazione quando la pagina è l'ultima; le richieste in più vengono annullate.
+    """
+    lookahead = SEARCH_LOOKAHEAD if lookahead is None else max(0, lookahead)
+    pool = ThreadPoolExecutor(max_workers=lookahead + 1)
+    futures = {}
+    next_page = 1
+    page = 1
+    try:
+        while last_page is None or page <= last_page:
+            while next_page <= page + lookahead and (last_page is None or next_page <= last_page):
+                futures[next_page] = pool.submit(fetch_page, next_page)
+                next_page += 1
+            yield page, futures.pop(page).result()
+            page += 1
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _fetch_search_page(query, page):
+    search_url = f"{BASE_URL}/index.php?search=1&key={query.replace(' ', '+')}&page={page}"
+    referer_query = urllib.parse.quote_plus(query)
+    headers = {
+        "User-Agent": USER_AGENT,
+        "Referer": safe_ascii_header(f"{BASE_URL}/animelist?search={referer_query}"),
+        "X-Requested-With": "XMLHttpRequest",
+        "Accept": "application/json, text/javascript, */*; q=0.01"
+    }
+    resp = get_session().get(search_url, headers=headers, timeout=TIMEOUT)
+    resp.raise_for_status()
+    return resp.json()
+
+def iter_search_anime(query):
+    """Come search_anime, ma restituisce i risultati pagina per pagina mentre le successive sono in download"""
+    pages = _iter_pages_speculative(lambda page: _fetch_search_page(query, page))
+    with closing(pages):
+        for page, page_results in pages:
+            if not page_results:
+                break
+            for item in page_results:
+                yield {
+                    "title": item["name"],
+                    "url": f"{BASE_URL}/anime/{item['link']}"
+                }
+            # Se meno di 20 risultati (o la quantità che AnimeSaturn mostra per pagina), siamo all'ultima pagina
+            if len(page_results) < 20:
+                break
+
 def search_anime(query):
     """Ricerca anime tramite la barra di ricerca di AnimeSaturn, con paginazione"""
-    results = []
-    page = 1
-    while True:
-        search_url = f"{BASE_URL}/index.php?search=1&key={query.replace(' ', '+')}&page={page}"
-        referer_query = urllib.parse.quote_plus(query)
-        headers = {
-            "User-Agent": USER_AGENT,
-            "Referer": safe_ascii_header(f"{BASE_URL}/animelist?search={referer_query}"),
-            "X-Requested-With": "XMLHttpRequest",
-            "Accept": "application/json, text/javascript, */*; q=0.01"
-        }
-        resp = requests.get(search_url, headers=headers, timeout=TIMEOUT)
-        resp.raise_for_status()
-        page_results = resp.json()
-        if not page_results:
-            break
-        for item in page_results:
-            results.append({
-                "title": item["name"],
-                "url": f"{BASE_URL}/anime/{item['link']}"
-            })
-        # Se meno di 20 risultati (o la quantità che AnimeSaturn mostra per pagina), siamo all'ultima pagina
-        if len(page_results) < 20:
-            break
-        page += 1
-    return results
+    return list(iter_search_anime(query))
+
+# Dump su disco delle pagine non riconosciute ed elenco completo dei link: solo con ANIMESATURN_DEBUG=1
+DEBUG_MODE = os.environ.get("ANIMESATURN_DEBUG", "").lower() in ("1", "true", "yes")
+BUTTON_CLASS_RE = re.compile(r"btn|button")
+
+def _absolute(href):
+    return href if href.startswith("http") else BASE_URL + href
+
+def find_watch_url(html_content):
+    """
+    Link alla pagina watch in un'unica scansione di <a>, <iframe> e <button>, con le priorità di sempre:
+    1. <a> con un <div> "Guarda lo streaming"  2. <a> con "/watch" nell'href
+    3. <iframe> con "/watch" nel src  4. <a> con classe btn/button e testo "Guarda".
+    A parità di regola vince il primo nella pagina. Restituisce (url, regola) o (None, None).
+    """
+    soup = _soup(html_content, only=["a", "iframe", "button"])
+    best = {}
+    for tag in soup.find_all(["a", "iframe", "button"]):
+        if tag.name == "a" and tag.get("href") is not None:
+            href = tag["href"]
+            if DEBUG_MODE and "/watch" in href:
+                print(f"[DEBUG] LINK TROVATO: {tag.get_text().strip()[:30]} => {href}", file=sys.stderr)
+            div = tag.find("div")
+            if div and "Guarda lo streaming" in div.get_text():
+                # Priorità massima: non serve guardare oltre
+                return _absolute(href), "Guarda lo streaming"
+            if "/watch" in href:
+                best.setdefault(2, href)
+        elif tag.name == "iframe" and "/watch" in (tag.get("src") or ""):
+            best.setdefault(3, tag["src"])
+        if (tag.name in ("a", "button") and 4 not in best
+                and any(BUTTON_CLASS_RE.search(cls) for cls in tag.get("class") or [])
+                and "Guarda" in tag.get_text()):
+            print(f"[DEBUG] Trovato pulsante con 'Guarda': {tag}", file=sys.stderr)
+            if tag.name == "a" and tag.get("href"):
+                best[4] = tag["href"]
+    rules = {2: "generico watch", 3: "iframe", 4: "pulsante Guarda"}
+    for rank in sorted(best):
+        return _absolute(best[rank]), rules[rank]
+    return None, None
 
 def get_watch_url(episode_url):
     print(f"[DEBUG] GET watch URL da: {episode_url}", file=sys.stderr)
-    resp = requests.get(episode_url, headers=HEADERS, timeout=TIMEOUT)
+    resp = get_session().get(episode_url, headers=HEADERS, timeout=TIMEOUT)
     resp.raise_for_status()
     html_content = resp.text
-    soup = BeautifulSoup(html_content, "html.parser")
-    
-    # Stampa tutti i link per debug
-    print("[DEBUG] Lista di tutti i link nella pagina:", file=sys.stderr)
-    for a in soup.find_all("a", href=True):
-        if "/watch" in a["href"]:
-            print(f"[DEBUG] LINK TROVATO: {a.get_text().strip()[:30]} => {a['href']}", file=sys.stderr)
-    
-    # Cerca il link con testo "Guarda lo streaming"
-    for a in soup.find_all("a", href=True):
-        div = a.find("div")
-        if div and "Guarda lo streaming" in div.get_text():
-            url = a["href"] if a["href"].startswith("http") else BASE_URL + a["href"]
-            print(f"[DEBUG] Trovato link 'Guarda lo streaming': {url}", file=sys.stderr)
-            return url
-    
-    # Cerca qualsiasi link che contenga "/watch"
-    for a in soup.find_all("a", href=True):
-        if "/watch" in a["href"]:
-            url = a["href"] if a["href"].startswith("http") else BASE_URL + a["href"]
-            print(f"[DEBUG] Trovato link generico watch: {url}", file=sys.stderr)
-            return url
-    
-    # Fallback: cerca il link alla pagina watch
-    watch_link = soup.find("a", href=re.compile(r"/watch"))
-    if watch_link:
-        url = watch_link["href"] if watch_link["href"].startswith("http") else BASE_URL + watch_link["href"]
-        print(f"[DEBUG] Trovato link watch (a): {url}", file=sys.stderr)
-        return url
-    
-    # Cerca in iframe
-    iframe = soup.find("iframe", src=re.compile(r"/watch"))
-    if iframe:
-        url = iframe["src"] if iframe["src"].startswith("http") else BASE_URL + iframe["src"]
-        print(f"[DEBUG] Trovato link watch (iframe): {url}", file=sys.stderr)
+
+    url, rule = find_watch_url(html_content)
+    if url:
+        print(f"[DEBUG] Trovato link watch ({rule}): {url}", file=sys.stderr)
         return url
-    
-    # Cerca pulsanti con "Guarda" nel testo
-    for button in soup.find_all(["button", "a"], class_=re.compile(r"btn|button")):
-        if "Guarda" in button.get_text():
-            print(f"[DEBUG] Trovato pulsante con 'Guarda': {button}", file=sys.stderr)
-            if button.name == "a" and button.get("href"):
-                url = button["href"] if button["href"].startswith("http") else BASE_URL + button["href"]
-                print(f"[DEBUG] Trovato link nel pulsante: {url}", file=sys.stderr)
-                return url
-    
+
     # Debug se non trova nulla
     print(f"[DEBUG] Nessun link watch trovato nella pagina", file=sys.stderr)
-    with open("debug_page.html", "w", encoding="utf-8") as f:
-        f.write(html_content)
-    print(f"[DEBUG] Salvata pagina di debug in debug_page.html", file=sys.stderr)
+    if DEBUG_MODE:
+        with open("debug_page.html", "w", encoding="utf-8") as f:
+            f.write(html_content)
+        print(f"[DEBUG] Salvata pagina di debug in debug_page.html", file=sys.stderr)
     return None
 
+# Pattern precompilati sui byte della risposta: il DOM si costruisce solo se una fase successiva ne ha bisogno
+MP4_BYTES_RE = re.compile(rb'https://[\w\.-]+/[^"\']+\.mp4')
+JWPLAYER_M3U8_BYTES_RE = re.compile(rb'jwplayer\([\'"]player_hls[\'"]\)\.setup\(\{\s*file:\s*[\'"]([^"\']+\.m3u8)[\'"]')
+SRC_M3U8_BYTES_RE = re.compile(rb'src=[\'"]([^"\']+\.m3u8)[\'"]')
+
+# Contatori per metodo di estrazione (quale strategia trova davvero il link), sommati tra processi.
+# Si accumulano in memoria e vanno su disco all'uscita o al più ogni EXTRACT_STATS_FLUSH_INTERVAL secondi
+EXTRACT_STATS_FILE = os.path.join(CACHE_DIR, "animesaturn_extract_stats.json")
+EXTRACT_STATS_FLUSH_INTERVAL = int(os.environ.get("ANIMESATURN_STATS_FLUSH_INTERVAL", "60"))
+EXTRACT_METHODS = ("mp4_regex", "vjs_tech_source", "jw_video_src", "jwplayer_m3u8",
+                   "alt_mp4_regex", "alt_video_source", "alt_m3u8_regex")
+_extract_stats_pending = {}
+_extract_stats_lock = threading.Lock()
+_extract_stats_flushed_at = None
+
+def _count_extract(*stats):
+    global _extract_stats_flushed_at
+    with _extract_stats_lock:
+        for stat in stats:
+            _extract_stats_pending[stat] = _extract_stats_pending.get(stat, 0) + 1
+        first_count = _extract_stats_flushed_at is None
+        due = not first_count and time.time() - _extract_stats_flushed_at >= EXTRACT_STATS_FLUSH_INTERVAL
+        if first_count:
+            _extract_stats_flushed_at = time.time()
+    if first_count:
+        # I processi singoli salvano all'uscita; in modalità serve anche periodicamente
+        import atexit
+        atexit.register(flush_extract_stats)
+    elif due:
+        flush_extract_stats()
+
+@contextmanager
+def _file_lock(path):
+    """Lock esclusivo tra processi (dove fcntl esiste) per le scritture read-modify-write"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def flush_extract_stats():
+    """Somma i contatori accumulati a quelli su disco"""
+    global _extract_stats_flushed_at
+    with _extract_stats_lock:
+        pending = dict(_extract_stats_pending)
+        _extract_stats_pending.clear()
+        _extract_stats_flushed_at = time.time()
+    if not pending:
+        return
+    try:
+        with _file_lock(EXTRACT_STATS_FILE):
+            stats = read_json_file(EXTRACT_STATS_FILE) or {}
+            for stat, count in pending.items():
+                stats[stat] = stats.get(stat, 0) + count
+            write_json_atomic(EXTRACT_STATS_FILE, stats, indent=2)
+    except OSError as e:
+        # Contatori rimessi in coda per il prossimo salvataggio
+        with _extract_stats_lock:
+            for stat, count in pending.items():
+                _extract_stats_pending[stat] = _extract_stats_pending.get(stat, 0) + count
+        print(f"[DEBUG] Impossibile salvare le statistiche di estrazione: {e}", file=sys.stderr)
+
+def extract_stats():
+    """Hit rate di ogni metodo sulle chiamate a extract_mp4_url registrate finora"""
+    flush_extract_stats()
+    stats = read_json_file(EXTRACT_STATS_FILE) or {}
+    calls = stats.get("calls", 0)
+    def rate(count):
+        return round(count / calls, 4) if calls else 0.0
+    return {
+        "calls": calls,
+        "methods": {method: {"hits": stats.get(method, 0), "hit_rate": rate(stats.get(method, 0))}
+                    for method in EXTRACT_METHODS},
+        "misses": {"hits": stats.get("miss", 0), "hit_rate": rate(stats.get("miss", 0))},
+        "dom_builds": {"hits": stats.get("dom_build", 0), "hit_rate": rate(stats.get("dom_build", 0))},
+    }
+
+def _lazy_soup(resp):
+    """DOM della risposta costruito al primo utilizzo e poi condiviso tra i metodi"""
+    built = []
+    def get():
+        if not built:
+            _count_extract("dom_build")
+            built.append(_soup(resp.text))
+        return built[0]
+    return get
+
+def _found(method, url):
+    # "calls" conta solo i tentativi arrivati in fondo: metodi vincenti + miss == calls
+    _count_extract("calls", method)
+    return url
+
 def extract_mp4_url(watch_url):
     print(f"[DEBUG] Analisi URL: {watch_url}", file=sys.stderr)
-    resp = requests.get(watch_url, headers=HEADERS, timeout=TIMEOUT)
+    resp = get_session().get(watch_url, headers=HEADERS, timeout=TIMEOUT)
     resp.raise_for_status()
-    html_content = resp.text
-    soup = BeautifulSoup(html_content, "html.parser")
-    
-    print(f"[DEBUG] Dimensione HTML: {len(html_content)} caratteri", file=sys.stderr)
-    
+    content = resp.content
+    soup = _lazy_soup(resp)
+
+    print(f"[DEBUG] Dimensione HTML: {len(content)} byte", file=sys.stderr)
+
     # Metodo 1: Cerca direttamente il link mp4 nel sorgente (metodo originale)
-    mp4_match = re.search(r'https://[\w\.-]+/[^"\']+\.mp4', html_content)
+    mp4_match = MP4_BYTES_RE.search(content)
     if mp4_match:
-        print(f"[DEBUG] Trovato MP4 con metodo 1: {mp4_match.group(0)}", file=sys.stderr)
-        return mp4_match.group(0)
-    
-    # Metodo 2: Analizza i tag video/source (metodo originale)
-    video = soup.find("video", class_="vjs-tech")
+        mp4_url = mp4_match.group(0).decode("utf-8", "replace")
+        print(f"[DEBUG] Trovato MP4 con metodo 1: {mp4_url}", file=sys.stderr)
+        return _found("mp4_regex", mp4_url)
+
+    # Metodo 2: Analizza i tag video/source (metodo originale); senza la classe nel sorgente il DOM non serve
+    video = soup().find("video", class_="vjs-tech") if b"vjs-tech" in content else None
     if video:
         print(f"[DEBUG] Trovato video con classe vjs-tech", file=sys.stderr)
         source = video.find("source")
         if source and source.get("src"):
             print(f"[DEBUG] Trovato source in vjs-tech: {source['src']}", file=sys.stderr)
-            return source["src"]
+            return _found("vjs_tech_source", source["src"])
     else:
         print("[DEBUG] Nessun video con classe vjs-tech trovato", file=sys.stderr)
-    
+
     # Metodo 3: Cerca nel tag video con classe jw-video (nuovo metodo)
-    jw_video = soup.find("video", class_="jw-video")
+    jw_video = soup().find("video", class_="jw-video") if b"jw-video" in content else None
     if jw_video:
         print(f"[DEBUG] Trovato video con classe jw-video", file=sys.stderr)
         if jw_video.get("src"):
             print(f"[DEBUG] Trovato src in jw-video: {jw_video['src']}", file=sys.stderr)
-            return jw_video["src"]
+            return _found("jw_video_src", jw_video["src"])
     else:
         print("[DEBUG] Nessun video con classe jw-video trovato", file=sys.stderr)
-    
+
     # Metodo 4: Cerca link m3u8 nel jwplayer setup
-    m3u8_match = re.search(r'jwplayer\([\'"]player_hls[\'"]\)\.setup\(\{\s*file:\s*[\'"]([^"\']+\.m3u8)[\'"]', html_content)
+    m3u8_match = JWPLAYER_M3U8_BYTES_RE.search(content)
     if m3u8_match:
-        print(f"[DEBUG] Trovato m3u8 con metodo jwplayer: {m3u8_match.group(1)}", file=sys.stderr)
-        return m3u8_match.group(1)
-    
+        m3u8_url = m3u8_match.group(1).decode("utf-8", "replace")
+        print(f"[DEBUG] Trovato m3u8 con metodo jwplayer: {m3u8_url}", file=sys.stderr)
+        return _found("jwplayer_m3u8", m3u8_url)
+
     # Cercare in altri posti della pagina per link alternativi
     player_alternativo = None
-    for a in soup.find_all("a", href=True):
-        if a.text and "Player alternativo" in a.text:
-            player_alternativo = a["href"]
-            if not player_alternativo.startswith('http'):
-                player_alternativo = BASE_URL + player_alternativo
-            print(f"[DEBUG] Trovato link a player alternativo: {player_alternativo}", file=sys.stderr)
-            break
-    
+    if b"Player alternativo" in content:
+        for a in soup().find_all("a", href=True):
+            if a.text and "Player alternativo" in a.text:
+                player_alternativo = a["href"]
+                if not player_alternativo.startswith('http'):
+                    player_alternativo = BASE_URL + player_alternativo
+                print(f"[DEBUG] Trovato link a player alternativo: {player_alternativo}", file=sys.stderr)
+                break
+
     # Se trovato un link al player alternativo, visita quella pagina
     if player_alternativo:
         try:
-            alt_resp = requests.get(player_alternativo, headers=HEADERS, timeout=TIMEOUT)
+            alt_resp = get_session().get(player_alternativo, headers=HEADERS, timeout=TIMEOUT)
             alt_resp.raise_for_status()
-            alt_soup = BeautifulSoup(alt_resp.text, "html.parser")
-            alt_html = alt_resp.text
-            
-            print(f"[DEBUG] Dimensione HTML player alternativo: {len(alt_html)} caratteri", file=sys.stderr)
-            
+            alt_content = alt_resp.content
+            alt_soup = _lazy_soup(alt_resp)
+
+            print(f"[DEBUG] Dimensione HTML player alternativo: {len(alt_content)} byte", file=sys.stderr)
+
             # Cerca mp4 nei metodi alternativi
-            alt_mp4_match = re.search(r'https://[\w\.-]+/[^"\']+\.mp4', alt_html)
+            alt_mp4_match = MP4_BYTES_RE.search(alt_content)
             if alt_mp4_match:
-                print(f"[DEBUG] Trovato MP4 nel player alternativo: {alt_mp4_match.group(0)}", file=sys.stderr)
-                return alt_mp4_match.group(0)
-            
+                alt_mp4_url = alt_mp4_match.group(0).decode("utf-8", "replace")
+                print(f"[DEBUG] Trovato MP4 nel player alternativo: {alt_mp4_url}", file=sys.stderr)
+                return _found("alt_mp4_regex", alt_mp4_url)
+
             # Cerca source in video
-            alt_video = alt_soup.find("video")
+            alt_video = alt_soup().find("video") if b"<video" in alt_content.lower() else None
             if alt_video:
                 print(f"[DEBUG] Trovato video nel player alternativo", file=sys.stderr)
                 alt_source = alt_video.find("source")
                 if alt_source and alt_source.get("src"):
                     print(f"[DEBUG] Trovato source nel player alternativo: {alt_source['src']}", file=sys.stderr)
-                    return alt_source["src"]
-            
+                    return _found("alt_video_source", alt_source["src"])
+
             # Cerca m3u8 nel player alternativo
-            m3u8_match = re.search(r'src=[\'"]([^"\']+\.m3u8)[\'"]', alt_html)
+            m3u8_match = SRC_M3U8_BYTES_RE.search(alt_content)
             if m3u8_match:
-                print(f"[DEBUG] Trovato m3u8 nel player alternativo: {m3u8_match.group(1)}", file=sys.stderr)
-                return m3u8_match.group(1)
-            
-            # Stampa i primi server disponibili per debug
-            server_dropdown = alt_soup.find("div", class_="dropdown-menu")
-            if server_dropdown:
-                print("[DEBUG] Server disponibili nel player alternativo:", file=sys.stderr)
-                for a in server_dropdown.find_all("a", href=True):
-                    print(f"[DEBUG] - {a.text.strip()}: {a['href']}", file=sys.stderr)
-            
-            # Prova a trovare iframe con video
-            iframe = alt_soup.find("iframe")
-            if iframe and iframe.get("src"):
-                print(f"[DEBUG] Trovato iframe nel player alternativo: {iframe['src']}", file=sys.stderr)
-            
+                m3u8_url = m3u8_match.group(1).decode("utf-8", "replace")
+                print(f"[DEBUG] Trovato m3u8 nel player alternativo: {m3u8_url}", file=sys.stderr)
+                return _found("alt_m3u8_regex", m3u8_url)
+
+            # Server e iframe disponibili: solo informazioni di debug, il DOM si costruisce solo se richiesto
+            if DEBUG_MODE:
+                server_dropdown = alt_soup().find("div", class_="dropdown-menu")
+                if server_dropdown:
+                    print("[DEBUG] Server disponibili nel player alternativo:", file=sys.stderr)
+                    for a in server_dropdown.find_all("a", href=True):
+                        print(f"[DEBUG] - {a.text.strip()}: {a['href']}", file=sys.stderr)
+
+                iframe = alt_soup().find("iframe")
+                if iframe and iframe.get("src"):
+                    print(f"[DEBUG] Trovato iframe nel player alternativo: {iframe['src']}", file=sys.stderr)
+
         except Exception as e:
             print(f"[DEBUG] Errore cercando nel player alternativo: {e}", file=sys.stderr)
     else:
         print("[DEBUG] Nessun player alternativo trovato", file=sys.stderr)
-    
+
     # Debug finale
     print("[DEBUG] Nessun link trovato dopo tutti i tentativi", file=sys.stderr)
+    _count_extract("calls", "miss")
     return None
 
 def get_episodes_list(anime_url):
-    resp = requests.get(anime_url, headers=HEADERS, timeout=TIMEOUT)
+    resp = get_session().get(anime_url, headers=HEADERS, timeout=TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = _soup(resp.text)
     episodes = []
     for a in soup.select("a.bottone-ep"):
         title = a.get_text(strip=True)
@@ -240,7 +590,7 @@ def download_mp4(mp4_url, referer_url, filename=None):
     if not filename:
         filename = mp4_url.split("/")[-1].split("?")[0]
     print(f"\n⬇️ Download in corso: {filename}\n")
-    r = requests.get(mp4_url, headers=headers, stream=True)
+    r = get_session().get(mp4_url, headers=headers, stream=True)
     r.raise_for_status()
     with open(filename, "wb") as f:
         for chunk in r.iter_content(chunk_size=8192):
@@ -248,31 +598,56 @@ def download_mp4(mp4_url, referer_url, filename=None):
                 f.write(chunk)
     print(f"✅ Download completato: {filename}\n")
 
+def _fetch_animelist_page(query, page):
+    """Link ai dettagli anime della pagina e presenza di una pagina successiva"""
+    url = f'{BASE_URL}/animelist?search={urllib.parse.quote_plus(query)}&page={page}'
+    resp = get_session().get(url, headers=HEADERS, timeout=TIMEOUT)
+    soup = _soup(resp.text)
+    links = []
+    # Seleziona solo i link principali ai dettagli anime
+    for a in soup.select('div.item-archivio h3 a[href^="/anime/"], div.item-archivio h3 a[href^="https://www.animesaturn.cx/anime/"]'):
+        href = a['href']
+        if not href.startswith('http'):
+            href = BASE_URL + href
+        links.append((a.get_text(strip=True), href))
+    pagination = soup.select_one('ul.pagination')
+    next_btn = soup.select_one('li.page-item.next:not(.disabled)')
+    return links, bool(pagination and next_btn)
+
+def iter_search_anime_html(query, max_pages=3):
+    """Come search_anime_html, ma restituisce i risultati man mano che le pagine arrivano"""
+    seen_urls = set()
+    pages = _iter_pages_speculative(lambda page: _fetch_animelist_page(query, page), last_page=max_pages)
+    with closing(pages):
+        for page, (links, has_next) in pages:
+            for title, href in links:
+                if href not in seen_urls:
+                    seen_urls.add(href)
+                    print(f"[DEBUG] Trovato titolo: {title} (url: {href})", file=sys.stderr)
+                    yield {'title': title, 'url': href, 'page': page}
+            if not has_next:
+                break
+
 def search_anime_html(query, max_pages=3):
     """Ricerca anime tramite la pagina HTML di AnimeSaturn, con paginazione solo se necessario"""
-    results = []
-    page = 1
-    while page <= max_pages:
-        url = f'{BASE_URL}/animelist?search={urllib.parse.quote_plus(query)}&page={page}'
-        resp = requests.get(url, headers=HEADERS, timeout=TIMEOUT)
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        # Seleziona solo i link principali ai dettagli anime
-        for a in soup.select('div.item-archivio h3 a[href^="/anime/"], div.item-archivio h3 a[href^="https://www.animesaturn.cx/anime/"]'):
-            title = a.get_text(strip=True)
-            href = a['href']
-            if not href.startswith('http'):
-                href = BASE_URL + href
-            if not any(r['url'] == href for r in results):
-                results.append({'title': title, 'url': href, 'page': page})
-                print(f"[DEBUG] Trovato titolo: {title} (url: {href})", file=sys.stderr)
-        pagination = soup.select_one('ul.pagination')
-        next_btn = soup.select_one('li.page-item.next:not(.disabled)')
-        if not (pagination and next_btn):
-            break
-        page += 1
-    return results
+    return list(iter_search_anime_html(query, max_pages))
 
 def search_anime_by_title_or_malid(title, mal_id):
+    """Ricerca per MAL ID: prima l'indice persistente, la catena di fallback solo per ID sconosciuti"""
+    indexed = mal_index_lookup(mal_id)
+    if indexed is not None:
+        print(f"[DEBUG] MAL ID {mal_id} dall'indice: {indexed}", file=sys.stderr)
+        return indexed
+    try:
+        matches = _search_by_title_or_malid(title, mal_id)
+    except Exception:
+        # Le pagine visitate finora restano comunque nell'indice
+        save_mal_index()
+        raise
+    record_mal_search(mal_id, matches)
+    return matches
+
+def _search_by_title_or_malid(title, mal_id):
     print(f"[DEBUG] INIZIO: title={title}, mal_id={mal_id}", file=sys.stderr)
 
     # Helper function to check a list of results for a MAL ID match
@@ -283,22 +658,21 @@ def search_anime_by_title_or_malid(title, mal_id):
         
         print(f"[DEBUG] {search_step_name}: Controllo {len(results_list)} risultati...", file=sys.stderr)
         matched_items = []
-        for item in results_list:
-            try:
-                resp = requests.get(item["url"], headers=HEADERS, timeout=TIMEOUT)
-                resp.raise_for_status()
-                soup = BeautifulSoup(resp.text, "html.parser")
-                mal_btn = soup.find("a", href=re.compile(r"myanimelist\.net/anime/(\d+)"))
-                if mal_btn:
-                    found_id_match = re.search(r"myanimelist\.net/anime/(\d+)", mal_btn["href"])
-                    if found_id_match:
-                        found_id = found_id_match.group(1)
-                        print(f"[DEBUG] -> Controllo '{item['title']}': trovato MAL ID {found_id} (cerco {target_mal_id})", file=sys.stderr)
-                        if found_id == str(target_mal_id):
-                            print(f"[DEBUG] MATCH TROVATO!", file=sys.stderr)
-                            matched_items.append(item)
-            except Exception as e:
-                print(f"[DEBUG] Errore visitando '{item['title']}': {e}", file=sys.stderr)
+        found_variants = set()
+        with closing(iter_candidate_mal_ids(results_list)) as candidates:
+            for item, found_id, error in candidates:
+                if error:
+                    print(f"[DEBUG] Errore visitando '{item['title']}': {error}", file=sys.stderr)
+                    continue
+                if found_id:
+                    print(f"[DEBUG] -> Controllo '{item['title']}': trovato MAL ID {found_id} (cerco {target_mal_id})", file=sys.stderr)
+                    if found_id == str(target_mal_id):
+                        print(f"[DEBUG] MATCH TROVATO!", file=sys.stderr)
+                        matched_items.append(item)
+                        found_variants.add(variant_of(item['title']))
+                        # Normale, ITA e CR già trovati: le altre visite vengono annullate
+                        if len(found_variants) == 3:
+                            break
         if matched_items:
             return matched_items
         print(f"[DEBUG] {search_step_name}: Nessun match trovato.", file=sys.stderr)
@@ -337,37 +711,30 @@ def search_anime_by_title_or_malid(title, mal_id):
         found_ita = None
         found_cr = None
         found_count = 0
-        for item in unique_fuzzy_results:
-            try:
+        with closing(iter_candidate_mal_ids(unique_fuzzy_results)) as candidates:
+            for item, found_id, error in candidates:
                 print(f"[DEBUG] Visito URL: {item['url']}", file=sys.stderr)
-                resp = requests.get(item["url"], headers=HEADERS, timeout=TIMEOUT)
-                resp.raise_for_status()
-                soup = BeautifulSoup(resp.text, "html.parser")
-                mal_btn = soup.find("a", href=re.compile(r"myanimelist\.net/anime/(\d+)"))
-                if mal_btn:
-                    found_id_match = re.search(r"myanimelist\.net/anime/(\d+)", mal_btn["href"])
-                    if found_id_match:
-                        found_id = found_id_match.group(1)
-                        print(f"[DEBUG] -> Controllo '{item['title']}': trovato MAL ID {found_id} (cerco {mal_id})", file=sys.stderr)
-                        if found_id == str(mal_id):
-                            print(f"[DEBUG] MATCH TROVATO!", file=sys.stderr)
-                            t_upper = item['title'].upper()
-                            if not found_normal and '(ITA' not in t_upper and '(CR' not in t_upper:
-                                found_normal = item
-                                found_count += 1
-                            elif not found_ita and '(ITA' in t_upper:
-                                found_ita = item
-                                found_count += 1
-                            elif not found_cr and '(CR' in t_upper:
-                                found_cr = item
-                            # Se hai trovato normal e ita, continua a cercare CR fino a fine terza pagina
-                            if found_normal and found_ita and found_cr:
-                                break
-            except Exception as e:
-                print(f"[DEBUG] Errore visitando '{item['title']}': {e}", file=sys.stderr)
-            # Se hai già trovato normal e ita e sei oltre la terza pagina, esci
-            if item.get('page', 1) >= 3 and found_normal and found_ita:
-                break
+                if error:
+                    print(f"[DEBUG] Errore visitando '{item['title']}': {error}", file=sys.stderr)
+                elif found_id:
+                    print(f"[DEBUG] -> Controllo '{item['title']}': trovato MAL ID {found_id} (cerco {mal_id})", file=sys.stderr)
+                    if found_id == str(mal_id):
+                        print(f"[DEBUG] MATCH TROVATO!", file=sys.stderr)
+                        t_upper = item['title'].upper()
+                        if not found_normal and '(ITA' not in t_upper and '(CR' not in t_upper:
+                            found_normal = item
+                            found_count += 1
+                        elif not found_ita and '(ITA' in t_upper:
+                            found_ita = item
+                            found_count += 1
+                        elif not found_cr and '(CR' in t_upper:
+                            found_cr = item
+                        # Se hai trovato normal e ita, continua a cercare CR fino a fine terza pagina
+                        if found_normal and found_ita and found_cr:
+                            break
+                # Se hai già trovato normal e ita e sei oltre la terza pagina, esci
+                if item.get('page', 1) >= 3 and found_normal and found_ita:
+                    break
         # Aggiungi le versioni trovate
         if found_normal:
             fuzzy_matches.append(found_normal)
@@ -464,7 +831,51 @@ def main():
         print("   • Struttura della pagina cambiata")
         print("   • Problemi di connessione")
 
-def main_cli():
+def build_stream(episode_url, mfp_proxy_url=None, mfp_proxy_password=None):
+    """Restituisce l'oggetto stream per Stremio (o {"url": None} se l'estrazione fallisce)"""
+    watch_url = get_watch_url(episode_url)
+    stream_url = extract_mp4_url(watch_url) if watch_url else None
+    stremio_stream = None
+
+    if stream_url:
+        # Verificare se è un URL m3u8
+        if stream_url.endswith(".m3u8"):
+            if mfp_proxy_url and mfp_proxy_password:
+                # Costruisci URL proxy per l'm3u8, rimuovendo eventuali https:// già presenti nell'URL
+                mfp_url_normalized = mfp_proxy_url.replace("https://", "").replace("http://", "")
+                if mfp_url_normalized.endswith("/"):
+                    mfp_url_normalized = mfp_url_normalized[:-1]
+                proxy_url = f"https://{mfp_url_normalized}/proxy/hls/manifest.m3u8?d={stream_url}&api_password={mfp_proxy_password}"
+                stremio_stream = {
+                    "url": proxy_url,
+                    "headers": {
+                        "Referer": watch_url,
+                        "User-Agent": USER_AGENT
+                    }
+                }
+            else:
+                # Se non ci sono parametri proxy, usa l'URL diretto
+                stremio_stream = {
+                    "url": stream_url,
+                    "headers": {
+                        "Referer": watch_url,
+                        "User-Agent": USER_AGENT
+                    }
+                }
+        else:
+            # Per gli URL MP4, usa il formato originale
+            stremio_stream = {
+                "url": stream_url,
+                "headers": {
+                    "Referer": watch_url,
+                    "User-Agent": USER_AGENT
+                }
+            }
+
+    # Test: se vuoi solo il link, restituisci {"url": stream_url}
+    return stremio_stream if stremio_stream else {"url": stream_url}
+
+def build_parser():
     parser = argparse.ArgumentParser(description="AnimeSaturn Scraper CLI")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
@@ -483,65 +894,83 @@ def main_cli():
     stream_parser.add_argument("--mfp-proxy-url", required=False, help="MediaFlow Proxy URL for m3u8 streams")
     stream_parser.add_argument("--mfp-proxy-password", required=False, help="MediaFlow Proxy Password for m3u8 streams")
 
-    args = parser.parse_args()
+    # Stats command
+    subparsers.add_parser("stats", help="Show how often each MP4 extraction method succeeds")
 
+    # Serve command
+    subparsers.add_parser("serve", help="Keep running and answer JSON-lines requests on stdin/stdout")
+
+    return parser
+
+def run_command(args):
     if args.command == "search":
         if getattr(args, "mal_id", None):
-            results = search_anime_by_title_or_malid(args.query, args.mal_id)
-        else:
-            results = search_anime(args.query)
-        print(json.dumps(results, indent=2))
+            return search_anime_by_title_or_malid(args.query, args.mal_id)
+        return search_anime(args.query)
     elif args.command == "get_episodes":
-        results = get_episodes_list(args.anime_url)
-        print(json.dumps(results, indent=2))
+        return get_episodes_list(args.anime_url)
     elif args.command == "get_stream":
-        watch_url = get_watch_url(args.episode_url)
-        stream_url = extract_mp4_url(watch_url) if watch_url else None
-        stremio_stream = None
-        
-        if stream_url:
-            # Verificare se è un URL m3u8
-            if stream_url.endswith(".m3u8"):
-                # Leggi i parametri di proxy MFP (se sono stati passati come argomento)
-                mfp_proxy_url = getattr(args, "mfp_proxy_url", None)
-                mfp_proxy_password = getattr(args, "mfp_proxy_password", None)
-                
-                if mfp_proxy_url and mfp_proxy_password:
-                    # Costruisci URL proxy per l'm3u8, rimuovendo eventuali https:// già presenti nell'URL
-                    mfp_url_normalized = mfp_proxy_url.replace("https://", "").replace("http://", "")
-                    if mfp_url_normalized.endswith("/"):
-                        mfp_url_normalized = mfp_url_normalized[:-1]
-                    proxy_url = f"https://{mfp_url_normalized}/proxy/hls/manifest.m3u8?d={stream_url}&api_password={mfp_proxy_password}"
-                    stremio_stream = {
-                        "url": proxy_url,
-                        "headers": {
-                            "Referer": watch_url,
-                            "User-Agent": USER_AGENT
-                        }
-                    }
-                else:
-                    # Se non ci sono parametri proxy, usa l'URL diretto
-                    stremio_stream = {
-                        "url": stream_url,
-                        "headers": {
-                            "Referer": watch_url,
-                            "User-Agent": USER_AGENT
-                        }
-                    }
-            else:
-                # Per gli URL MP4, usa il formato originale
-                stremio_stream = {
-                    "url": stream_url,
-                    "headers": {
-                        "Referer": watch_url,
-                        "User-Agent": USER_AGENT
-                    }
-                }
-                
-        # Test: se vuoi solo il link, restituisci {"url": stream_url}
-        print(json.dumps(stremio_stream if stremio_stream else {"url": stream_url}, indent=2))
+        return build_stream(
+            args.episode_url,
+            getattr(args, "mfp_proxy_url", None),
+            getattr(args, "mfp_proxy_password", None)
+        )
+    elif args.command == "stats":
+        return extract_stats()
+    raise ValueError(f"Comando non supportato: {args.command}")
+
+def serve(parser):
+    """
+    Resta in ascolto su stdin: ogni riga è {"id": ..., "argv": [...]} con gli stessi argomenti del CLI.
+    Su stdout scrive {"id": ..., "ok": true, "result": ...} oppure {"id": ..., "ok": false, "error": "..."}.
+    """
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    write_lock = threading.Lock()
+
+    def respond(message):
+        with write_lock:
+            out.write(json.dumps(message) + "\n")
+            out.flush()
+
+    def run(request):
+        req_id = request.get("id")
+        try:
+            args = parser.parse_args(list(request.get("argv") or []))
+            if args.command == "serve":
+                raise ValueError("serve non può essere annidato")
+            respond({"id": req_id, "ok": True, "result": run_command(args)})
+        except SystemExit:
+            respond({"id": req_id, "ok": False, "error": f"Argomenti non validi: {request.get('argv')}"})
+        except Exception as e:
+            respond({"id": req_id, "ok": False, "error": str(e)})
+
+    workers = int(os.environ.get("SIDECAR_WORKERS", "8"))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                respond({"id": None, "ok": False, "error": f"Richiesta non valida: {e}"})
+                continue
+            pool.submit(run, request)
+
+def main_cli():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(parser)
+        return
+
+    results = run_command(args)
+    print(json.dumps(results, indent=2))
 
 if __name__ == "__main__":
+    handle_profile_startup(lambda: (get_session(), _soup("")))
     if len(sys.argv) > 1:
         main_cli()
     else:
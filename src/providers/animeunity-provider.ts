@@ -3,8 +3,14 @@ import { KitsuProvider } from './kitsu';
 import { formatMediaFlowUrl } from '../utils/mediaflow';
 import { AnimeUnityConfig, StreamForStremio } from '../types/animeunity';
 import * as path from 'path';
+import { PythonSidecar, SidecarUnavailableError } from '../utils/pythonSidecar';
 import axios from 'axios';
 
+// Processo Python persistente condiviso da tutte le richieste (disattivabile con PYTHON_SIDECAR=false)
+const sidecar = process.env.PYTHON_SIDECAR === 'false'
+    ? null
+    : new PythonSidecar(path.join(__dirname, 'animeunity_scraper.py'), ['serve'], 'AnimeUnity');
+
 // Helper function to invoke the Python scraper
 async function invokePythonScraper(args: string[]): Promise<any> {
     const scriptPath = path.join(__dirname, 'animeunity_scraper.py');
@@ -12,6 +18,26 @@ async function invokePythonScraper(args: string[]): Promise<any> {
     // Use python3, ensure it's in the system's PATH
     const command = 'python3';
 
+    if (sidecar) {
+        let response;
+        try {
+            response = await sidecar.request(args);
+        } catch (err) {
+            // Un timeout non va ripetuto: il sidecar sta ancora eseguendo la stessa richiesta
+            if (!(err instanceof SidecarUnavailableError)) {
+                throw err;
+            }
+            // Sidecar non disponibile: ripiega sul processo singolo
+            console.warn('Python sidecar unavailable, falling back to spawn:', err.message);
+        }
+        if (response) {
+            if (!response.ok) {
+                throw new Error(`Python script error: ${response.error}`);
+            }
+            return response.result;
+        }
+    }
+
     return new Promise((resolve, reject) => {
         const pythonProcess = spawn(command, [scriptPath, ...args]);
 
@@ -67,6 +93,18 @@ interface AnimeUnityStreamData {
     mp4_url: string;
 }
 
+// Risposta del comando "pipeline": ricerca, episodi e stream in un'unica chiamata
+interface AnimeUnityPipelineResult {
+    search_results: number;
+    matched: number;
+    streams: {
+        version: AnimeUnitySearchResult;
+        language_type: string;
+        episode: AnimeUnityEpisode;
+        stream: AnimeUnityStreamData;
+    }[];
+}
+
 // Funzione universale per ottenere il titolo inglese da qualsiasi ID
 async function getEnglishTitleFromAnyId(id: string, type: 'imdb'|'tmdb'|'kitsu'|'mal', tmdbApiKey?: string): Promise<string> {
   let malId: string | null = null;
@@ -299,7 +337,31 @@ export class AnimeUnityProvider {
   async handleTitleRequest(title: string, seasonNumber: number | null, episodeNumber: number | null, isMovie = false): Promise<{ streams: StreamForStremio[] }> {
     const normalizedTitle = normalizeTitleForSearch(title);
     console.log(`[AnimeUnity] Titolo normalizzato per ricerca: ${normalizedTitle}`);
-    let animeVersions = await this.searchAllVersions(normalizedTitle);
+    // Percorso veloce: ricerca SUB/DUB, episodi e stream in un'unica chiamata allo script
+    // La pipeline ha già cercato il titolo con tutte le sue varianti: se non trova nulla restano solo i titoli alternativi
+    let pipelineMissed = false;
+    try {
+      const pipelineArgs = ['pipeline', '--title', normalizedTitle];
+      if (isMovie) {
+        pipelineArgs.push('--movie');
+      } else if (episodeNumber != null) {
+        pipelineArgs.push('--episode', String(episodeNumber));
+      }
+      const pipelineResult: AnimeUnityPipelineResult = await invokePythonScraper(pipelineArgs);
+      if (pipelineResult.search_results > 0) {
+        console.log(`[AnimeUnity] Pipeline: ${pipelineResult.matched} versioni, ${pipelineResult.streams.length} stream`);
+        const streams: StreamForStremio[] = [];
+        const seenLinks = new Set<string>();
+        for (const { version, language_type, stream } of pipelineResult.streams) {
+          this.appendStreams(streams, seenLinks, version, language_type, stream, seasonNumber, episodeNumber);
+        }
+        return { streams };
+      }
+      pipelineMissed = true;
+    } catch (error) {
+      console.warn('[AnimeUnity] Pipeline non disponibile, uso il percorso classico:', (error as Error).message);
+    }
+    let animeVersions = pipelineMissed ? [] : await this.searchAllVersions(normalizedTitle);
     // Fallback: se non trova nulla, prova anche con titoli alternativi
     if (!animeVersions.length) {
       // Prova a ottenere titoli alternativi da Jikan (se hai il MAL ID)
@@ -325,17 +387,17 @@ export class AnimeUnityProvider {
         }
       }
       // Fallback: senza apostrofi
-      if (!animeVersions.length && normalizedTitle.includes("'")) {
+      if (!animeVersions.length && !pipelineMissed && normalizedTitle.includes("'")) {
         const noApos = normalizedTitle.replace(/'/g, "");
         animeVersions = await this.searchAllVersions(noApos);
       }
       // Fallback: senza parentesi
-      if (!animeVersions.length && normalizedTitle.includes("(")) {
+      if (!animeVersions.length && !pipelineMissed && normalizedTitle.includes("(")) {
         const noParens = normalizedTitle.split("(")[0].trim();
         animeVersions = await this.searchAllVersions(noParens);
       }
       // Fallback: prime 3 parole
-      if (!animeVersions.length) {
+      if (!animeVersions.length && !pipelineMissed) {
         const words = normalizedTitle.split(" ");
         if (words.length > 3) {
           const first3 = words.slice(0, 3).join(" ");
@@ -349,7 +411,7 @@ export class AnimeUnityProvider {
       return { streams: [] };
     }
     const streams: StreamForStremio[] = [];
-    const seenLinks = new Set();
+    const seenLinks = new Set<string>();
     for (const { version, language_type } of animeVersions) {
       const episodes: AnimeUnityEpisode[] = await invokePythonScraper(['get_episodes', '--anime-id', String(version.id)]);
       // Filtra undefined e episodi nulli
@@ -379,48 +441,60 @@ export class AnimeUnityProvider {
         '--anime-slug', version.slug,
         '--episode-id', String(targetEpisode.id)
       ]);
-      if (streamResult.mp4_url) {
-        const mediaFlowUrl = formatMediaFlowUrl(
-          streamResult.mp4_url,
-          this.config.mfpUrl,
-          this.config.mfpPassword
-        );
-        const cleanName = version.name
-          .replace(/\s*\(ITA\)/i, '')
-          .replace(/\s*\(CR\)/i, '')
-          .replace(/ITA/gi, '')
-          .replace(/CR/gi, '')
-          .trim();
-        const sNum = seasonNumber || 1;
-        let streamTitle = `${capitalize(cleanName)} ${language_type} S${sNum}`;
-        if (episodeNumber) {
-          streamTitle += `E${episodeNumber}`;
-        }
-        // Filtra duplicati per url
-        if (!seenLinks.has(mediaFlowUrl)) {
-          streams.push({
-            title: streamTitle,
-            url: mediaFlowUrl,
-            behaviorHints: {
-              notWebReady: true
-            }
-          });
-          seenLinks.add(mediaFlowUrl);
-        }
-        if (this.config.bothLink && streamResult.embed_url && !seenLinks.has(streamResult.embed_url)) {
-          streams.push({
-            title: `[E] ${streamTitle}`,
-            url: streamResult.embed_url,
-            behaviorHints: {
-              notWebReady: true
-            }
-          });
-          seenLinks.add(streamResult.embed_url);
-        }
-      }
+      this.appendStreams(streams, seenLinks, version, language_type, streamResult, seasonNumber, episodeNumber);
     }
     return { streams };
   }
+
+  private appendStreams(
+    streams: StreamForStremio[],
+    seenLinks: Set<string>,
+    version: AnimeUnitySearchResult,
+    language_type: string,
+    streamResult: AnimeUnityStreamData,
+    seasonNumber: number | null,
+    episodeNumber: number | null
+  ): void {
+    if (streamResult.mp4_url) {
+      const mediaFlowUrl = formatMediaFlowUrl(
+        streamResult.mp4_url,
+        this.config.mfpUrl,
+        this.config.mfpPassword
+      );
+      const cleanName = version.name
+        .replace(/\s*\(ITA\)/i, '')
+        .replace(/\s*\(CR\)/i, '')
+        .replace(/ITA/gi, '')
+        .replace(/CR/gi, '')
+        .trim();
+      const sNum = seasonNumber || 1;
+      let streamTitle = `${capitalize(cleanName)} ${language_type} S${sNum}`;
+      if (episodeNumber) {
+        streamTitle += `E${episodeNumber}`;
+      }
+      // Filtra duplicati per url
+      if (!seenLinks.has(mediaFlowUrl)) {
+        streams.push({
+          title: streamTitle,
+          url: mediaFlowUrl,
+          behaviorHints: {
+            notWebReady: true
+          }
+        });
+        seenLinks.add(mediaFlowUrl);
+      }
+      if (this.config.bothLink && streamResult.embed_url && !seenLinks.has(streamResult.embed_url)) {
+        streams.push({
+          title: `[E] ${streamTitle}`,
+          url: streamResult.embed_url,
+          behaviorHints: {
+            notWebReady: true
+          }
+        });
+        seenLinks.add(streamResult.embed_url);
+      }
+    }
+  }
 }
 
 // Funzione di utilità per capitalizzare la prima lettera
@@ -6,17 +6,82 @@ Mostra sia l'embed URL VixCloud che il link MP4 finale
 Dipendenze: requests, beautifulsoup4 (pip install requests beautifulsoup4)
 """
 
-import requests
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import json
 import re
-import time
 import argparse
 import sys
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urljoin, unquote
+import importlib
+import threading
+import html
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urljoin, unquote, parse_qsl
 import json, os
-with open(os.path.join(os.path.dirname(__file__), '../../config/domains.json'), encoding='utf-8') as f:
-    DOMAINS = json.load(f)
+
+# Costo (ms) delle fasi di avvio e degli import pesanti, mostrato da --profile-startup
+STARTUP_PROFILE = {}
+
+# --- Helper comuni: identici in vavoo_resolver.py, animeunity_scraper.py e animesaturn.py.
+# La build copia ogni script da solo in dist/, quindi nessuno dei tre può importare un modulo condiviso:
+# una modifica qui va riportata anche negli altri due. ---
+
+def _timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    STARTUP_PROFILE[label] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+def startup_report():
+    """Tempi di avvio: inizializzazione del modulo e import/caricamenti effettivamente eseguiti"""
+    heavy = ("requests", "urllib3", "bs4", "charset_normalizer", "idna", "certifi")
+    return {
+        "phases_ms": STARTUP_PROFILE,
+        "heavy_modules_loaded": sorted(name for name in heavy if name in sys.modules),
+        "total_ms": round((time.perf_counter() - _STARTUP_T0) * 1000, 2),
+    }
+
+def handle_profile_startup(load_heavy_modules):
+    """
+    --profile-startup da solo carica tutti i moduli pesanti (load_heavy_modules) e stampa il report;
+    insieme a un comando riporta su stderr, all'uscita, cosa ha caricato quel comando
+    """
+    if "--profile-startup" not in sys.argv:
+        return
+    sys.argv.remove("--profile-startup")
+    STARTUP_PROFILE["module init"] = round((time.perf_counter() - _STARTUP_T0) * 1000, 2)
+    if len(sys.argv) == 1:
+        load_heavy_modules()
+        print(json.dumps(startup_report(), indent=2))
+        sys.exit(0)
+    import atexit
+    atexit.register(lambda: print(f"[STARTUP] {json.dumps(startup_report())}", file=sys.stderr))
+
+def read_json_file(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """Scrive su un file temporaneo e poi rinomina, così chi legge non vede mai un file a metà"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+    os.replace(tmp_path, path)
+
+# --- Fine helper comuni ---
+
+def _load_domains():
+    with open(os.path.join(os.path.dirname(__file__), '../../config/domains.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+DOMAINS = _timed("config/domains.json", _load_domains)
 BASE_URL = f"https://www.{DOMAINS['animeunity']}"
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 HEADERS = {
@@ -29,15 +94,46 @@ HEADERS = {
 }
 TIMEOUT = 20
 
-def get_session_tokens():
-    """Recupera token di sessione per le richieste API"""
-    response = requests.get(f"{BASE_URL}/", headers=HEADERS, timeout=TIMEOUT)
-    response.raise_for_status()
-
-    soup = BeautifulSoup(response.text, "html.parser")
-    csrf_token = soup.select_one("meta[name=csrf-token]")["content"]
-    cookies = response.cookies.get_dict()
-
+# requests e bs4 vengono importati solo quando servono davvero (prima richiesta di rete / primo parsing HTML)
+_session = None
+_session_lock = threading.Lock()
+_soup_class = None
+
+def get_session():
+    """Sessione HTTP condivisa tra le chiamate (connessioni keep-alive riusate in modalità serve)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            requests = _timed("import requests", lambda: importlib.import_module("requests"))
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            _session = requests.Session()
+        return _session
+
+def _soup(markup):
+    global _soup_class
+    if _soup_class is None:
+        _soup_class = _timed("import bs4", lambda: importlib.import_module("bs4")).BeautifulSoup
+    return _soup_class(markup, "html.parser")
+
+# Directory per i file di cache condivisi tra le invocazioni (come config/, nella root del progetto)
+CACHE_DIR = os.environ.get("ANIMEUNITY_CACHE_DIR", os.path.join(os.path.dirname(__file__), '../../cache'))
+
+# Token CSRF + cookie di sessione: riusati (memoria, poi disco) finché non scadono o il server li rifiuta
+TOKEN_CACHE_FILE = os.path.join(CACHE_DIR, "animeunity_tokens.json")
+TOKEN_TTL = int(os.environ.get("ANIMEUNITY_TOKEN_TTL", "3600"))
+# 419 è la risposta di Laravel a un token CSRF scaduto
+TOKEN_REJECTED_STATUS = (401, 403, 419)
+CSRF_META_RE = re.compile(
+    r'<meta\s+(?:name=["\']csrf-token["\']\s+content=["\']([^"\']+)["\']'
+    r'|content=["\']([^"\']+)["\']\s+name=["\']csrf-token["\'])',
+    re.IGNORECASE,
+)
+
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+def _session_data(csrf_token, cookies):
     return {
         "csrf_token": csrf_token,
         "cookies": cookies,
@@ -50,10 +146,83 @@ def get_session_tokens():
         }
     }
 
+def fetch_session_tokens():
+    """Scarica la homepage e legge il meta csrf-token (regex, con bs4 solo come riserva)"""
+    response = get_session().get(f"{BASE_URL}/", headers=HEADERS, timeout=TIMEOUT)
+    response.raise_for_status()
+
+    match = CSRF_META_RE.search(response.text)
+    if match:
+        csrf_token = match.group(1) or match.group(2)
+    else:
+        csrf_token = _soup(response.text).select_one("meta[name=csrf-token]")["content"]
+    return csrf_token, response.cookies.get_dict()
+
+def _store_tokens(csrf_token, cookies):
+    entry = {"csrf_token": csrf_token, "cookies": cookies, "fetched_at": time.time()}
+    with _tokens_lock:
+        _tokens.clear()
+        _tokens.update(entry)
+    try:
+        write_json_atomic(TOKEN_CACHE_FILE, entry)
+    except OSError as e:
+        print(f"[DEBUG] Impossibile salvare i token: {e}", file=sys.stderr)
+
+def invalidate_session_tokens():
+    """Scarta i token in memoria e su disco (es. dopo un 419 dal server)"""
+    with _tokens_lock:
+        _tokens.clear()
+    try:
+        os.remove(TOKEN_CACHE_FILE)
+    except OSError:
+        pass
+
+def get_session_tokens(force_refresh=False):
+    """Recupera token di sessione per le richieste API (dalla cache se ancora validi)"""
+    if not force_refresh:
+        with _tokens_lock:
+            entry = dict(_tokens)
+        if not entry:
+            entry = read_json_file(TOKEN_CACHE_FILE) or {}
+            if entry.get("csrf_token"):
+                with _tokens_lock:
+                    _tokens.update(entry)
+        if entry.get("csrf_token") and time.time() - entry.get("fetched_at", 0) < TOKEN_TTL:
+            return _session_data(entry["csrf_token"], entry.get("cookies", {}))
+
+    csrf_token, cookies = fetch_session_tokens()
+    _store_tokens(csrf_token, cookies)
+    return _session_data(csrf_token, cookies)
+
+def post_api(url, payload):
+    """POST verso le API interne con i token in cache; se vengono rifiutati li rinnova una volta e riprova"""
+    session_data = get_session_tokens()
+    for attempt in range(2):
+        response = get_session().post(
+            url,
+            json=payload,
+            headers=session_data["session_headers"],
+            cookies=session_data["cookies"],
+            timeout=TIMEOUT
+        )
+        if response.status_code not in TOKEN_REJECTED_STATUS or attempt:
+            break
+        print(f"[DEBUG] Token rifiutati ({response.status_code}), rinnovo e riprovo", file=sys.stderr)
+        invalidate_session_tokens()
+        session_data = get_session_tokens(force_refresh=True)
+    response.raise_for_status()
+    return response
+
+def _search_endpoint(endpoint):
+    response = post_api(endpoint["url"], endpoint["payload"])
+    data = response.json()
+    print(f"Debug: Risposta da {endpoint['url']}: {data.get('records', [])[:2]}", file=sys.stderr)
+    return data.get("records", [])
+
 def search_anime(query, dubbed=False):
-    """Ricerca anime tramite API livesearch e archivio"""
+    """Ricerca anime tramite API livesearch e archivio (interrogate in parallelo)"""
     try:
-        session_data = get_session_tokens()
+        get_session_tokens()
     except Exception as e:
         print(f"⚠️ Errore ottenimento token di sessione: {e}", file=sys.stderr)
         return []
@@ -61,7 +230,7 @@ def search_anime(query, dubbed=False):
     results = []
     seen_ids = set()
 
-    # Endpoint di ricerca
+    # Endpoint di ricerca, in ordine di priorità per l'unione dei risultati
     search_endpoints = [
         {"url": f"{BASE_URL}/livesearch", "payload": {"title": query}},
         {"url": f"{BASE_URL}/archivio/get-animes", "payload": {
@@ -71,73 +240,168 @@ def search_anime(query, dubbed=False):
         }}
     ]
 
-    for endpoint in search_endpoints:
+    with ThreadPoolExecutor(max_workers=len(search_endpoints)) as pool:
+        futures = [pool.submit(_search_endpoint, endpoint) for endpoint in search_endpoints]
+
+    for endpoint, future in zip(search_endpoints, futures):
         try:
-            response = requests.post(
-                endpoint["url"],
-                json=endpoint["payload"],
-                headers=session_data["session_headers"],
-                cookies=session_data["cookies"],
-                timeout=TIMEOUT
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            print(f"Debug: Risposta da {endpoint['url']}: {data.get('records', [])[:2]}", file=sys.stderr)
-
-            for record in data.get("records", []):
-                if not record or not record.get("id"):
-                    continue
-                anime_id = record["id"]
-                if anime_id not in seen_ids:
-                    seen_ids.add(anime_id)
-                    title = (record.get("title_it") or
-                            record.get("title_eng") or
-                            record.get("title") or "")
-                    if title.strip():
-                        results.append({
-                            "id": anime_id,
-                            "slug": record.get("slug", ""),
-                            "name": title.strip(),
-                            "episodes_count": record.get("episodes_count", 0)
-                        })
+            records = future.result()
         except Exception as e:
             # Print error to stderr so it doesn't interfere with JSON output
             print(f"⚠️ Errore ricerca {endpoint['url']}: {e}", file=sys.stderr)
             continue
 
+        for record in records:
+            if not record or not record.get("id"):
+                continue
+            anime_id = record["id"]
+            if anime_id not in seen_ids:
+                seen_ids.add(anime_id)
+                title = (record.get("title_it") or
+                        record.get("title_eng") or
+                        record.get("title") or "")
+                if title.strip():
+                    results.append({
+                        "id": anime_id,
+                        "slug": record.get("slug", ""),
+                        "name": title.strip(),
+                        "episodes_count": record.get("episodes_count", 0)
+                    })
+
     print(f"Debug: Trovati {len(results)} risultati per '{query}'", file=sys.stderr)
     return results
 
-def search_anime_with_fallback(query, dubbed=False):
-    results = search_anime(query, dubbed)
-    if results:
-        return results
+def query_variants(query):
+    """Query originale seguita dai fallback, in ordine di priorità e senza duplicati"""
+    variants = [query]
     # Fallback: senza apostrofi
     if "'" in query or "’" in query:
-        results = search_anime(query.replace("'", "").replace("’", ""))
-        if results:
-            return results
+        variants.append(query.replace("'", "").replace("’", ""))
     # Fallback: senza parentesi
     if "(" in query:
-        results = search_anime(query.split("(")[0].strip(), dubbed)
-        if results:
-            return results
+        variants.append(query.split("(")[0].strip())
     # Fallback: prime 3 parole
     words = query.split()
     if len(words) > 3:
-        results = search_anime(" ".join(words[:3]), dubbed)
-        if results:
-            return results
+        variants.append(" ".join(words[:3]))
+    unique = []
+    for variant in variants:
+        if variant and variant not in unique:
+            unique.append(variant)
+    return unique
+
+def search_anime_with_fallback(query, dubbed=False):
+    """
+    Lancia insieme la query e tutti i fallback, ma restituisce i risultati della variante
+    a priorità più alta che ne ha trovati: appena è nota, le più lente vengono abbandonate.
+    """
+    variants = query_variants(query)
+    if len(variants) == 1:
+        return search_anime(query, dubbed)
+
+    # Token pronti prima di partire, così le varianti non scaricano la homepage in parallelo
+    try:
+        get_session_tokens()
+    except Exception:
+        pass
+
+    finished = queue.Queue()
+
+    def run(priority, variant):
+        try:
+            finished.put((priority, search_anime(variant, dubbed)))
+        except Exception as e:
+            print(f"⚠️ Errore ricerca '{variant}': {e}", file=sys.stderr)
+            finished.put((priority, []))
+
+    # Thread daemon: quelli abbandonati non trattengono l'uscita del processo
+    for priority, variant in enumerate(variants):
+        threading.Thread(target=run, args=(priority, variant), daemon=True).start()
+
+    tiers = {}
+    next_tier = 0
+    while next_tier < len(variants):
+        priority, results = finished.get()
+        tiers[priority] = results
+        while next_tier in tiers:
+            if tiers[next_tier]:
+                if next_tier:
+                    print(f"Debug: Risultati dal fallback '{variants[next_tier]}'", file=sys.stderr)
+                return tiers[next_tier]
+            next_tier += 1
     return []
 
-def get_episodes_list(anime_id):
-    """Recupera lista episodi tramite API info_api"""
+# Cache degli episodi per anime_id: entro EPISODES_TTL si risponde dal disco, dopo si scaricano solo i range nuovi
+EPISODES_CACHE_DIR = os.path.join(CACHE_DIR, "animeunity_episodes")
+EPISODES_TTL = int(os.environ.get("ANIMEUNITY_EPISODES_TTL", "900"))
+EPISODES_RANGE_SIZE = 120
+EPISODES_WORKERS = int(os.environ.get("ANIMEUNITY_EPISODES_WORKERS", "4"))
+
+def _episodes_cache_path(anime_id):
+    return os.path.join(EPISODES_CACHE_DIR, f"{anime_id}.json")
+
+def load_cached_episodes(anime_id):
+    entry = read_json_file(_episodes_cache_path(anime_id))
+    if not isinstance(entry, dict) or not isinstance(entry.get("episodes"), list):
+        return None
+    return entry
+
+def _fetch_episode_range(anime_id, start, end):
+    episodes_response = get_session().get(
+        f"{BASE_URL}/info_api/{anime_id}/1",
+        params={"start_range": start, "end_range": end},
+        headers=HEADERS,
+        timeout=TIMEOUT
+    )
+    episodes_response.raise_for_status()
+    return episodes_response.json().get("episodes", [])
+
+def fetch_episode_ranges(anime_id, first, total_episodes):
+    """
+    Scarica in parallelo i batch da 120 episodi tra first e total_episodes.
+    Restituisce (episodi in ordine, ultima posizione scaricata): in caso di errore tiene solo i batch contigui riusciti.
+    """
+    ranges = [(start, min(start + EPISODES_RANGE_SIZE - 1, total_episodes))
+              for start in range(first, total_episodes + 1, EPISODES_RANGE_SIZE)]
+    if not ranges:
+        return [], total_episodes
+    with ThreadPoolExecutor(max_workers=min(EPISODES_WORKERS, len(ranges))) as pool:
+        futures = [pool.submit(_fetch_episode_range, anime_id, start, end) for start, end in ranges]
+
     episodes = []
+    fetched_until = first - 1
+    for (start, end), future in zip(ranges, futures):
+        try:
+            episodes.extend(future.result())
+        except Exception as e:
+            print(f"⚠️ Errore recupero episodi {start}-{end}: {e}", file=sys.stderr)
+            break
+        fetched_until = end
+    return episodes, fetched_until
+
+def merge_episodes(episodes, new_episodes):
+    """Unisce per id: un episodio già noto viene aggiornato al suo posto, i nuovi vanno in coda"""
+    merged = {}
+    for episode in episodes + new_episodes:
+        if episode and episode.get("id") is not None:
+            merged[episode["id"]] = episode
+    return list(merged.values())
+
+def get_episodes_list(anime_id):
+    """Recupera lista episodi tramite API info_api (incrementale rispetto alla cache su disco)"""
+    cached = load_cached_episodes(anime_id)
+    if cached and time.time() - cached.get("fetched_at", 0) < EPISODES_TTL:
+        print(f"Debug: Episodi di {anime_id} dalla cache ({len(cached['episodes'])})", file=sys.stderr)
+        return cached["episodes"]
+
+    episodes = cached["episodes"] if cached else []
+    # Posizione (nei range di info_api) fin dove la lista è già stata scaricata: non coincide con
+    # len(episodes) quando l'API restituisce meno voci del conteggio (buchi, speciali, episodi 0)
+    fetched_until = cached.get("fetched_until", cached.get("episodes_count", 0)) if cached else 0
 
     try:
         # Ottieni conteggio episodi
-        count_response = requests.get(
+        count_response = get_session().get(
             f"{BASE_URL}/info_api/{anime_id}/",
             headers=HEADERS,
             timeout=TIMEOUT
@@ -145,20 +409,27 @@ def get_episodes_list(anime_id):
         count_response.raise_for_status()
         total_episodes = count_response.json().get("episodes_count", 0)
 
-        # Recupera episodi in batch
-        start = 1
-        while start <= total_episodes:
-            end = min(start + 119, total_episodes)
-
-            episodes_response = requests.get(
-                f"{BASE_URL}/info_api/{anime_id}/1",
-                params={"start_range": start, "end_range": end},
-                headers=HEADERS,
-                timeout=TIMEOUT
-            )
-            episodes_response.raise_for_status()
-            episodes.extend(episodes_response.json().get("episodes", []))
-            start = end + 1
+        # Conteggio sceso sotto quanto già scaricato: non è un'aggiunta, si riscarica tutto
+        if total_episodes < fetched_until:
+            episodes = []
+            fetched_until = 0
+
+        # Solo i range oltre l'ultima posizione nota (serie in corso)
+        new_episodes, fetched_until = fetch_episode_ranges(anime_id, fetched_until + 1, total_episodes)
+        episodes = merge_episodes(episodes, new_episodes)
+        if new_episodes:
+            print(f"Debug: {len(new_episodes)} nuovi episodi per {anime_id}", file=sys.stderr)
+
+        try:
+            write_json_atomic(_episodes_cache_path(anime_id), {
+                "episodes": episodes,
+                "episodes_count": total_episodes,
+                "fetched_until": fetched_until,
+                # Lista incompleta: niente TTL, la prossima chiamata riprende dai range mancanti
+                "fetched_at": time.time() if fetched_until >= total_episodes else 0,
+            })
+        except OSError as e:
+            print(f"[DEBUG] Impossibile salvare la cache episodi: {e}", file=sys.stderr)
 
     except Exception as e:
         print(f"⚠️ Errore recupero episodi: {e}", file=sys.stderr)
@@ -170,13 +441,131 @@ def get_video_page_content(anime_id, anime_slug, episode_id):
     episode_url = f"{BASE_URL}/anime/{anime_id}-{anime_slug}/{episode_id}"
 
     try:
-        response = requests.get(episode_url, headers=HEADERS, timeout=TIMEOUT)
+        response = get_session().get(episode_url, headers=HEADERS, timeout=TIMEOUT)
         response.raise_for_status()
         return response.text
     except Exception as e:
         print(f"⚠️ Errore caricamento pagina episodio: {e}", file=sys.stderr)
         return None
 
+# Pattern precompilati per l'estrazione veloce: il DOM completo (bs4) serve solo come riserva
+VIDEO_PLAYER_EMBED_RE = re.compile(r'<video-player\b[^>]*?\sembed_url\s*=\s*(["\'])(.*?)\1', re.IGNORECASE | re.DOTALL)
+VIXCLOUD_IFRAME_RE = re.compile(r'<iframe[^>]+src="([^"]*vixcloud[^"]+)"')
+SCRIPT_BODY_RE = re.compile(r'<script\b[^>]*>(.*?)</script\s*>', re.IGNORECASE | re.DOTALL)
+SCRIPT_MP4_RE = re.compile(r"(?:src_mp4|file)\s*[:=]\s*[\"']([^\"']+\.mp4[^\"']*)[\"']")
+MP4_PATTERNS = [
+    re.compile(r"(?:file|source|src)\s*[:=]\s*[\"']([^\"']*au-d1-[^\"']*\.mp4[^\"']*)[\"']", re.IGNORECASE),
+    re.compile(r"[\"']([^\"']*scws-content\.net[^\"']*\.mp4[^\"']*)[\"']", re.IGNORECASE),
+    re.compile(r"(?:mp4|video)(?:Url|Source|File)\s*[:=]\s*[\"']([^\"']+\.mp4[^\"']*)[\"']", re.IGNORECASE),
+]
+CONFIG_JSON_RE = re.compile(r'(?:config|window\.config)\s*=\s*(\{.*?\});', re.DOTALL)
+
+def _normalize_embed_url(embed_url):
+    if embed_url.startswith("//"):
+        return "https:" + embed_url
+    if embed_url.startswith("/"):
+        return urljoin(BASE_URL, embed_url)
+    return embed_url
+
+def _embed_url_soup(page_content):
+    """Metodo originale: DOM completo della pagina episodio"""
+    video_player = _soup(page_content).select_one("video-player")
+    if video_player and video_player.get("embed_url"):
+        return video_player["embed_url"]
+    return None
+
+def _embed_url_fast(page_content):
+    """Legge solo l'attributo embed_url del tag video-player, senza costruire il DOM"""
+    match = VIDEO_PLAYER_EMBED_RE.search(page_content)
+    if match and match.group(2):
+        return html.unescape(match.group(2))
+    return None
+
+def extract_embed_url(page_content):
+    """Embed URL di VixCloud dalla pagina episodio: regex, poi bs4 solo se il tag c'è ma la regex non lo legge, poi iframe"""
+    embed_url = _embed_url_fast(page_content)
+    if not embed_url and "video-player" in page_content.lower():
+        embed_url = _embed_url_soup(page_content)
+
+    # Fallback: cerca iframe VixCloud
+    if not embed_url:
+        iframe_match = VIXCLOUD_IFRAME_RE.search(page_content)
+        if iframe_match:
+            embed_url = iframe_match.group(1)
+
+    return _normalize_embed_url(embed_url) if embed_url else None
+
+def _script_mp4(script_texts):
+    for text in script_texts:
+        if text:
+            # Pattern per link MP4 diretto
+            mp4_match = SCRIPT_MP4_RE.search(text)
+            if mp4_match:
+                # Decodifica eventuali escape sequences
+                mp4_url = mp4_match.group(1).replace("\\/", "/")
+                if mp4_url.startswith("http"):
+                    return mp4_url
+    return None
+
+def _script_mp4_soup(page_html):
+    """Metodo originale: DOM completo e scansione di tutti gli <script>"""
+    return _script_mp4(script.string for script in _soup(page_html).find_all("script"))
+
+def _script_mp4_fast(page_html):
+    """Scorre i corpi degli <script> con una regex e si ferma al primo link valido"""
+    return _script_mp4(match.group(1) for match in SCRIPT_BODY_RE.finditer(page_html))
+
+def extract_mp4_from_embed_html(page_html):
+    """Estrae il link MP4 dall'HTML della pagina embed di VixCloud"""
+    # Metodo 1: Cerca script con src_mp4 (logica MP4_downloader)
+    mp4_url = _script_mp4_fast(page_html)
+    if not mp4_url and "<script" in page_html.lower() and not SCRIPT_BODY_RE.search(page_html):
+        # HTML malformato (script non chiusi): la regex non basta, serve il parser
+        mp4_url = _script_mp4_soup(page_html)
+    if mp4_url:
+        return mp4_url
+
+    # Metodo 2: Cerca variabili JavaScript con URL MP4
+    for pattern in MP4_PATTERNS:
+        for match in pattern.findall(page_html):
+            clean_url = match.replace("\\/", "/")
+            if "token=" in clean_url and "expires=" in clean_url:
+                return clean_url
+
+    # Metodo 3: Parsing JSON configuration (fallback per M3U8->MP4)
+    json_match = CONFIG_JSON_RE.search(page_html)
+    if json_match:
+        try:
+            config = json.loads(json_match.group(1))
+
+            # Cerca URL base e converti da M3U8 a MP4
+            for key in ["masterPlaylist", "window_parameter", "streams"]:
+                if key in config and isinstance(config[key], dict):
+                    base_url = config[key].get("url", "")
+                    if "playlist" in base_url and "vixcloud.co" in base_url:
+                        # Sostituisci /playlist/ con /download/ per ottenere MP4
+                        mp4_url = base_url.replace("/playlist/", "/download/")
+                        mp4_url = mp4_url.replace("m3u8", "mp4")
+
+                        # Aggiungi parametri di qualità se disponibili
+                        params = config[key].get("params", {})
+                        if params:
+                            token = params.get("token", "")
+                            expires = params.get("expires", "")
+                            if token and expires:
+                                separator = "&" if "?" in mp4_url else "?"
+                                mp4_url += f"{separator}token={token}&expires={expires}"
+
+                                # Aggiungi qualità se FHD disponibile
+                                if config.get("canPlayFHD", False):
+                                    mp4_url += "&quality=1080p"
+
+                                return mp4_url
+        except json.JSONDecodeError:
+            pass
+
+    return None
+
 def extract_mp4_from_vixcloud(embed_url):
     """
     Estrae link MP4 diretto da VixCloud
@@ -192,9 +581,7 @@ def extract_mp4_from_vixcloud(embed_url):
         }
 
         # Richiesta pagina embed con SSL disabilitato
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        response = requests.get(
+        response = get_session().get(
             embed_url,
             headers=vixcloud_headers,
             timeout=TIMEOUT,
@@ -202,123 +589,307 @@ def extract_mp4_from_vixcloud(embed_url):
         )
         response.raise_for_status()
 
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # Metodo 1: Cerca script con src_mp4 (logica MP4_downloader)
-        scripts = soup.find_all("script")
-        for script in scripts:
-            if script.string:
-                # Pattern per link MP4 diretto
-                mp4_match = re.search(r"(?:src_mp4|file)\s*[:=]\s*[\"']([^\"']+\.mp4[^\"']*)[\"']", script.string)
-                if mp4_match:
-                    mp4_url = mp4_match.group(1)
-                    # Decodifica eventuali escape sequences
-                    mp4_url = mp4_url.replace("\\/", "/")
-                    if mp4_url.startswith("http"):
-                        return mp4_url
-
-        # Metodo 2: Cerca variabili JavaScript con URL MP4
-        full_text = response.text
-        mp4_patterns = [
-            r"(?:file|source|src)\s*[:=]\s*[\"']([^\"']*au-d1-[^\"']*\.mp4[^\"']*)[\"']",
-            r"[\"']([^\"']*scws-content\.net[^\"']*\.mp4[^\"']*)[\"']",
-            r"(?:mp4|video)(?:Url|Source|File)\s*[:=]\s*[\"']([^\"']+\.mp4[^\"']*)[\"']"
-        ]
-
-        for pattern in mp4_patterns:
-            matches = re.findall(pattern, full_text, re.IGNORECASE)
-            for match in matches:
-                clean_url = match.replace("\\/", "/")
-                if "token=" in clean_url and "expires=" in clean_url:
-                    return clean_url
-
-        # Metodo 3: Parsing JSON configuration (fallback per M3U8->MP4)
-        json_match = re.search(r'(?:config|window\.config)\s*=\s*(\{.*?\});', full_text, re.DOTALL)
-        if json_match:
-            try:
-                config = json.loads(json_match.group(1))
-
-                # Cerca URL base e converti da M3U8 a MP4
-                for key in ["masterPlaylist", "window_parameter", "streams"]:
-                    if key in config and isinstance(config[key], dict):
-                        base_url = config[key].get("url", "")
-                        if "playlist" in base_url and "vixcloud.co" in base_url:
-                            # Sostituisci /playlist/ con /download/ per ottenere MP4
-                            mp4_url = base_url.replace("/playlist/", "/download/")
-                            mp4_url = mp4_url.replace("m3u8", "mp4")
-
-                            # Aggiungi parametri di qualità se disponibili
-                            params = config[key].get("params", {})
-                            if params:
-                                token = params.get("token", "")
-                                expires = params.get("expires", "")
-                                if token and expires:
-                                    separator = "&" if "?" in mp4_url else "?"
-                                    mp4_url += f"{separator}token={token}&expires={expires}"
-
-                                    # Aggiungi qualità se FHD disponibile
-                                    if config.get("canPlayFHD", False):
-                                        mp4_url += "&quality=1080p"
-
-                                    return mp4_url
-            except json.JSONDecodeError:
-                pass
-
-        return None
+        return extract_mp4_from_embed_html(response.text)
 
     except Exception as e:
         print(f"⚠️ Errore estrazione VixCloud: {e}", file=sys.stderr)
         return None
 
+# Cache dei risultati di get_stream per (anime_id, episode_id): valida fino a "expires" del link MP4 meno un margine
+STREAM_CACHE_FILE = os.path.join(CACHE_DIR, "animeunity_streams.json")
+STREAM_EXPIRY_MARGIN = int(os.environ.get("ANIMEUNITY_STREAM_EXPIRY_MARGIN", "300"))
+
+_stream_cache = None
+_stream_lock = threading.Lock()
+
+def _stream_key(anime_id, episode_id):
+    return f"{anime_id}:{episode_id}"
+
+def url_expiry(url):
+    """Scadenza (epoch secondi) dal parametro expires dell'URL, o None se assente"""
+    for key, value in parse_qsl(urlparse(url).query):
+        if key.lower() == "expires":
+            try:
+                number = float(value)
+            except ValueError:
+                return None
+            return number / 1000 if number > 1e12 else number
+    return None
+
+def _load_stream_cache():
+    global _stream_cache
+    with _stream_lock:
+        if _stream_cache is None:
+            data = read_json_file(STREAM_CACHE_FILE)
+            _stream_cache = data if isinstance(data, dict) else {}
+        return _stream_cache
+
+def _embed_still_valid(entry, now):
+    """L'embed URL porta una propria scadenza: finché vale si può riusare senza rileggere la pagina episodio"""
+    embed_expiry = url_expiry(entry.get("embed_url") or "")
+    return bool(embed_expiry) and embed_expiry - STREAM_EXPIRY_MARGIN > now
+
+def cached_stream(anime_id, episode_id):
+    """Voce in cache (anche con MP4 scaduto, per riusarne l'embed URL) o None"""
+    return _load_stream_cache().get(_stream_key(anime_id, episode_id))
+
+def _store_stream(anime_id, episode_id, result):
+    expires_at = url_expiry(result["mp4_url"])
+    if not expires_at:
+        return
+    entry = dict(result, expires_at=expires_at - STREAM_EXPIRY_MARGIN)
+    cache = _load_stream_cache()
+    now = time.time()
+    with _stream_lock:
+        # Unisce con quanto scritto da altri processi e scarta le voci ormai inutilizzabili
+        merged = read_json_file(STREAM_CACHE_FILE) or {}
+        merged.update(cache)
+        merged[_stream_key(anime_id, episode_id)] = entry
+        merged = {key: value for key, value in merged.items()
+                  if value.get("expires_at", 0) > now or _embed_still_valid(value, now)}
+        cache.clear()
+        cache.update(merged)
+        try:
+            write_json_atomic(STREAM_CACHE_FILE, merged)
+        except OSError as e:
+            print(f"[DEBUG] Impossibile salvare la cache stream: {e}", file=sys.stderr)
+
 def get_stream(anime_id, anime_slug, episode_id):
     """
     Estrae sia embed URL che MP4 link
     Restituisce un dizionario con entrambi i link
     """
+    episode_page_url = f"{BASE_URL}/anime/{anime_id}-{anime_slug}/{episode_id}"
+
+    cached = cached_stream(anime_id, episode_id)
+    if cached and cached.get("expires_at", 0) > time.time():
+        print(f"Debug: Stream {anime_id}/{episode_id} dalla cache", file=sys.stderr)
+        return {"episode_page": cached["episode_page"], "embed_url": cached["embed_url"], "mp4_url": cached["mp4_url"]}
+
+    # MP4 scaduto ma embed URL ancora valido: si salta la pagina episodio
+    if cached and _embed_still_valid(cached, time.time()):
+        mp4_url = extract_mp4_from_vixcloud(cached["embed_url"])
+        if mp4_url:
+            result = {"episode_page": episode_page_url, "embed_url": cached["embed_url"], "mp4_url": mp4_url}
+            _store_stream(anime_id, episode_id, result)
+            return result
+
     # Ottieni contenuto pagina episodio
     page_content = get_video_page_content(anime_id, anime_slug, episode_id)
     if not page_content:
         return {"embed_url": None, "mp4_url": None, "episode_page": None}
 
-    episode_page_url = f"{BASE_URL}/anime/{anime_id}-{anime_slug}/{episode_id}"
-
     # Cerca embed URL di VixCloud
-    soup = BeautifulSoup(page_content, "html.parser")
-    embed_url = None
-
-    # Cerca video-player tag con embed_url
-    video_player = soup.select_one("video-player")
-    if video_player and video_player.get("embed_url"):
-        embed_url = video_player["embed_url"]
-
-        # Normalizza URL se necessario
-        if embed_url.startswith("//"):
-            embed_url = "https:" + embed_url
-        elif embed_url.startswith("/"):
-            embed_url = urljoin(BASE_URL, embed_url)
-
-    # Fallback: cerca iframe VixCloud
-    if not embed_url:
-        iframe_match = re.search(r'<iframe[^>]+src="([^"]*vixcloud[^"]+)"', page_content)
-        if iframe_match:
-            embed_url = iframe_match.group(1)
-            if embed_url.startswith("//"):
-                embed_url = "https:" + embed_url
-            elif embed_url.startswith("/"):
-                embed_url = urljoin(BASE_URL, embed_url)
+    embed_url = extract_embed_url(page_content)
 
     # Estrai MP4 dall'embed URL (se trovato)
     mp4_url = None
     if embed_url:
         mp4_url = extract_mp4_from_vixcloud(embed_url)
 
-    return {
+    result = {
         "episode_page": episode_page_url,
         "embed_url": embed_url,
         "mp4_url": mp4_url
     }
+    if mp4_url:
+        _store_stream(anime_id, episode_id, result)
+    return result
 
-def main():
+# Estrazione di più episodi in parallelo e prefetch dell'episodio successivo nella cache stream
+STREAM_WORKERS = int(os.environ.get("ANIMEUNITY_STREAM_WORKERS", "4"))
+# In modalità serve il prefetch è attivo di default; da riga di comando serve --prefetch-next
+PREFETCH_NEXT = os.environ.get("ANIMEUNITY_PREFETCH_NEXT", "true").lower() != "false"
+
+_prefetching = set()
+_prefetch_lock = threading.Lock()
+
+def get_streams(anime_id, anime_slug, episode_ids, workers=None):
+    """get_stream su più episodi con concorrenza limitata; risultati nello stesso ordine di episode_ids"""
+    if not episode_ids:
+        return []
+    workers = max(1, min(workers or STREAM_WORKERS, len(episode_ids)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(get_stream, anime_id, anime_slug, episode_id) for episode_id in episode_ids]
+    results = []
+    for episode_id, future in zip(episode_ids, futures):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"⚠️ Errore stream episodio {episode_id}: {e}", file=sys.stderr)
+            result = {"embed_url": None, "mp4_url": None, "episode_page": None}
+        results.append(dict(result, episode_id=episode_id))
+    return results
+
+def _episode_number(episode):
+    try:
+        return float(episode.get("number"))
+    except (TypeError, ValueError):
+        return None
+
+def episode_ids_in_range(anime_id, first, last):
+    """ID degli episodi con numero tra first e last (inclusi), dalla lista episodi in cache"""
+    return [episode["id"] for episode in get_episodes_list(anime_id)
+            if _episode_number(episode) is not None and first <= _episode_number(episode) <= last]
+
+def next_episode_id(anime_id, episode_id):
+    """ID dell'episodio che segue episode_id nella lista, o None se è l'ultimo"""
+    episodes = get_episodes_list(anime_id)
+    for index, episode in enumerate(episodes[:-1]):
+        if str(episode.get("id")) == str(episode_id):
+            return episodes[index + 1].get("id")
+    return None
+
+def prefetch_next_episode(anime_id, anime_slug, episode_id):
+    """Risolve l'episodio N+1 e lo lascia nella cache stream, così la riproduzione successiva è immediata"""
+    try:
+        next_id = next_episode_id(anime_id, episode_id)
+        if next_id is None:
+            return
+        key = _stream_key(anime_id, next_id)
+        cached = cached_stream(anime_id, next_id)
+        if cached and cached.get("expires_at", 0) > time.time():
+            return
+        with _prefetch_lock:
+            if key in _prefetching:
+                return
+            _prefetching.add(key)
+        try:
+            print(f"Debug: Prefetch episodio {next_id} di {anime_id}", file=sys.stderr)
+            get_stream(anime_id, anime_slug, next_id)
+        finally:
+            with _prefetch_lock:
+                _prefetching.discard(key)
+    except Exception as e:
+        print(f"⚠️ Errore prefetch episodio successivo: {e}", file=sys.stderr)
+
+def start_prefetch_next(anime_id, anime_slug, episode_id, force=False):
+    """Prefetch dell'episodio successivo su un thread daemon (se PREFETCH_NEXT è attivo o force)"""
+    if not (PREFETCH_NEXT or force):
+        return
+    threading.Thread(
+        target=prefetch_next_episode,
+        args=(anime_id, anime_slug, episode_id),
+        daemon=True
+    ).start()
+
+def search_all_versions(title, dub_preference="both"):
+    """
+    Ricerca SUB e DUB in parallelo, unite senza duplicati (nome|id) e classificate come SUB/ITA/CR
+    (stessa logica di searchAllVersions in animeunity-provider.ts)
+    """
+    flags = {"sub": [False], "dub": [True]}.get(dub_preference, [False, True])
+    with ThreadPoolExecutor(max_workers=len(flags)) as pool:
+        futures = [pool.submit(search_anime_with_fallback, title, dubbed) for dubbed in flags]
+    all_results = []
+    for future in futures:
+        try:
+            all_results.extend(future.result() or [])
+        except Exception as e:
+            print(f"⚠️ Errore ricerca '{title}': {e}", file=sys.stderr)
+
+    versions = []
+    seen = set()
+    for result in all_results:
+        if not result or not result.get("name") or not result.get("id"):
+            continue
+        key = f"{result['name']}|{result['id']}"
+        if key in seen:
+            continue
+        seen.add(key)
+        name_lower = result["name"].lower()
+        language_type = "SUB"
+        if "cr" in name_lower:
+            language_type = "CR"
+        elif "ita" in name_lower:
+            language_type = "ITA"
+        versions.append({"version": result, "language_type": language_type})
+    return versions
+
+def filter_anime_results(versions, title):
+    """Tiene solo i titoli uguali a quello cercato, eventualmente con (ITA) e/o (CR) (come filterAnimeResults in TS)"""
+    def norm(value):
+        return re.sub(r"\s+", " ", value.lower()).strip()
+    base = norm(title)
+    allowed = {base, f"{base} (ita)", f"{base} (cr)", f"{base} (ita) (cr)"}
+    return [entry for entry in versions if norm(entry["version"]["name"]) in allowed]
+
+def select_episode(episodes, episode_number=None, is_movie=False):
+    valid_episodes = [episode for episode in episodes or [] if episode and episode.get("id") and episode.get("number")]
+    if not valid_episodes:
+        return None
+    if is_movie or episode_number is None:
+        return valid_episodes[0]
+    return next((episode for episode in valid_episodes if str(episode["number"]) == str(episode_number)), None)
+
+def _pipeline_version(entry, episode_number, is_movie):
+    version = entry["version"]
+    episode = select_episode(get_episodes_list(version["id"]), episode_number, is_movie)
+    if not episode:
+        print(f"⚠️ Nessun episodio {episode_number} per {version['name']}", file=sys.stderr)
+        return None
+    stream = get_stream(version["id"], version.get("slug", ""), episode["id"])
+    # Il percorso Stremio passa da qui e non dal comando get_stream: anche qui si prepara l'episodio N+1
+    if not is_movie:
+        start_prefetch_next(version["id"], version.get("slug", ""), episode["id"])
+    return dict(entry, episode=episode, stream=stream)
+
+def pipeline(title, episode_number=None, is_movie=False, dub_preference="both"):
+    """
+    Ricerca (SUB e DUB in parallelo), filtro sul titolo, episodi e stream in un'unica chiamata.
+    search_results permette al chiamante di distinguere "nessun risultato" da "nessuno stream".
+    """
+    versions = search_all_versions(title, dub_preference)
+    matched = filter_anime_results(versions, title)
+    print(f"Debug: Pipeline '{title}': {len(versions)} risultati, {len(matched)} dopo il filtro", file=sys.stderr)
+
+    results = []
+    if matched:
+        with ThreadPoolExecutor(max_workers=max(1, min(STREAM_WORKERS, len(matched)))) as pool:
+            futures = [pool.submit(_pipeline_version, entry, episode_number, is_movie) for entry in matched]
+        for entry, future in zip(matched, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"⚠️ Errore pipeline per {entry['version'].get('name')}: {e}", file=sys.stderr)
+                continue
+            if result:
+                results.append(result)
+
+    return {"search_results": len(versions), "matched": len(matched), "streams": results}
+
+def _time_parser(func, page, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(page)
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+def benchmark_parsers(paths, repeat=20):
+    """
+    Confronta estrazione veloce e DOM completo su pagine HTML salvate
+    (pagina episodio -> embed_url, pagina embed VixCloud -> link MP4 dagli script)
+    """
+    _soup("")  # import di bs4 escluso dalle misure
+    report = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            page = f.read()
+        entry = {"file": path, "bytes": len(page.encode("utf-8"))}
+        for name, fast, full in (("embed_url", _embed_url_fast, _embed_url_soup),
+                                 ("script_mp4", _script_mp4_fast, _script_mp4_soup)):
+            fast_result, fast_ms = _time_parser(fast, page, repeat)
+            full_result, full_ms = _time_parser(full, page, repeat)
+            entry[name] = {
+                "fast_ms": round(fast_ms, 3),
+                "soup_ms": round(full_ms, 3),
+                "speedup": round(full_ms / fast_ms, 1) if fast_ms else None,
+                "same_result": fast_result == full_result,
+                "result": fast_result,
+            }
+        report.append(entry)
+    return report
+
+def build_parser():
     parser = argparse.ArgumentParser(description="AnimeUnity Scraper CLI")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
@@ -336,22 +907,114 @@ def main():
     stream_parser.add_argument("--anime-id", required=True, help="AnimeUnity ID of the anime")
     stream_parser.add_argument("--anime-slug", required=True, help="Anime slug")
     stream_parser.add_argument("--episode-id", required=True, help="Episode ID")
-
-    args = parser.parse_args()
-    
-    # Disable SSL warnings
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
+    stream_parser.add_argument("--prefetch-next", action="store_true", help="After printing the result, resolve the next episode into the stream cache")
+
+    # Get streams command
+    streams_parser = subparsers.add_parser("get_streams", help="Get stream URLs for several episodes of an anime")
+    streams_parser.add_argument("--anime-id", required=True, help="AnimeUnity ID of the anime")
+    streams_parser.add_argument("--anime-slug", required=True, help="Anime slug")
+    streams_group = streams_parser.add_mutually_exclusive_group(required=True)
+    streams_group.add_argument("--episode-ids", help="Comma-separated episode IDs")
+    streams_group.add_argument("--episode-range", help="Episode numbers as FIRST-LAST (e.g. 1-12)")
+    streams_parser.add_argument("--workers", type=int, default=None, help="Concurrent extractions")
+
+    # Pipeline command
+    pipeline_parser = subparsers.add_parser("pipeline", help="Search, pick the episode and extract its stream in one call")
+    pipeline_parser.add_argument("--title", required=True, help="Anime title to search for")
+    pipeline_parser.add_argument("--episode", default=None, help="Episode number (default: first episode)")
+    pipeline_parser.add_argument("--movie", action="store_true", help="Treat the title as a movie (first episode)")
+    pipeline_parser.add_argument("--dub-preference", choices=["both", "sub", "dub"], default="both", help="Which searches to run")
+
+    # Benchmark command
+    benchmark_parser = subparsers.add_parser("benchmark_parsers", help="Compare fast extraction and full BeautifulSoup parsing on captured HTML pages")
+    benchmark_parser.add_argument("files", nargs="+", help="Captured episode or VixCloud embed pages")
+    benchmark_parser.add_argument("--repeat", type=int, default=20, help="Iterations per parser")
+
+    # Serve command
+    subparsers.add_parser("serve", help="Keep running and answer JSON-lines requests on stdin/stdout")
+
+    return parser
+
+def run_command(args):
+    """Esegue un comando già parsato e restituisce il risultato serializzabile in JSON"""
     if args.command == "search":
-        results = search_anime_with_fallback(args.query, args.dubbed)
-        print(json.dumps(results, indent=4))
+        return search_anime_with_fallback(args.query, args.dubbed)
     elif args.command == "get_episodes":
-        results = get_episodes_list(args.anime_id)
-        print(json.dumps(results, indent=4))
+        return get_episodes_list(args.anime_id)
     elif args.command == "get_stream":
-        results = get_stream(args.anime_id, args.anime_slug, args.episode_id)
-        print(json.dumps(results, indent=4))
+        return get_stream(args.anime_id, args.anime_slug, args.episode_id)
+    elif args.command == "get_streams":
+        if args.episode_ids:
+            episode_ids = [episode_id.strip() for episode_id in args.episode_ids.split(",") if episode_id.strip()]
+        else:
+            first, _, last = args.episode_range.partition("-")
+            episode_ids = episode_ids_in_range(args.anime_id, float(first), float(last or first))
+        return get_streams(args.anime_id, args.anime_slug, episode_ids, args.workers)
+    elif args.command == "pipeline":
+        return pipeline(args.title, args.episode, args.movie, args.dub_preference)
+    elif args.command == "benchmark_parsers":
+        return benchmark_parsers(args.files, args.repeat)
+    raise ValueError(f"Comando non supportato: {args.command}")
+
+def serve(parser):
+    """
+    Processo persistente: una richiesta JSON per riga su stdin, una risposta per riga su stdout.
+    Richiesta: {"id": 1, "argv": ["search", "--query", "Naruto"]}
+    Risposta:  {"id": 1, "ok": true, "result": [...]}
+    """
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    write_lock = threading.Lock()
+
+    def respond(message):
+        with write_lock:
+            out.write(json.dumps(message) + "\n")
+            out.flush()
+
+    def run(request):
+        req_id = request.get("id")
+        try:
+            args = parser.parse_args(list(request.get("argv") or []))
+            if args.command == "serve":
+                raise ValueError("serve non può essere annidato")
+            respond({"id": req_id, "ok": True, "result": run_command(args)})
+            if args.command == "get_stream":
+                start_prefetch_next(args.anime_id, args.anime_slug, args.episode_id, force=args.prefetch_next)
+        except SystemExit:
+            # argparse chiama sys.exit sugli argomenti non validi
+            respond({"id": req_id, "ok": False, "error": f"Argomenti non validi: {request.get('argv')}"})
+        except Exception as e:
+            respond({"id": req_id, "ok": False, "error": str(e)})
+
+    workers = int(os.environ.get("SIDECAR_WORKERS", "8"))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                respond({"id": None, "ok": False, "error": f"Richiesta non valida: {e}"})
+                continue
+            pool.submit(run, request)
+
+def main():
+    handle_profile_startup(lambda: (get_session(), _soup("")))
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(parser)
+        return
+
+    results = run_command(args)
+    print(json.dumps(results, indent=4))
+
+    if args.command == "get_stream" and args.prefetch_next:
+        # L'output è già completo: il prefetch allunga solo la vita del processo
+        sys.stdout.flush()
+        prefetch_next_episode(args.anime_id, args.anime_slug, args.episode_id)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,126 @@
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import * as readline from 'readline';
+
+// Risposta del protocollo JSON-lines esposto dagli script Python in modalità serve
+export interface SidecarResponse {
+    id: number;
+    ok: boolean;
+    result?: any;
+    code?: number;
+    output?: string | null;
+    error?: string;
+}
+
+/**
+ * Il processo non è disponibile (avvio fallito o terminato): solo in questo caso ha senso ripiegare
+ * su un processo singolo. Un timeout invece significa che il sidecar sta ancora lavorando alla richiesta.
+ */
+export class SidecarUnavailableError extends Error {
+    constructor(message: string) {
+        super(message);
+        this.name = 'SidecarUnavailableError';
+    }
+}
+
+export class SidecarTimeoutError extends Error {
+    constructor(message: string) {
+        super(message);
+        this.name = 'SidecarTimeoutError';
+    }
+}
+
+interface PendingRequest {
+    resolve: (response: SidecarResponse) => void;
+    reject: (error: Error) => void;
+    timer: NodeJS.Timeout;
+}
+
+/**
+ * Processo Python persistente: viene avviato alla prima richiesta e riusato per tutte le successive,
+ * così import, sessione HTTP e connessioni TLS restano "caldi".
+ * Se il processo muore, le richieste in corso vengono rifiutate e quello successivo viene riavviato.
+ */
+export class PythonSidecar {
+    private process: ChildProcessWithoutNullStreams | null = null;
+    private pending = new Map<number, PendingRequest>();
+    private nextId = 1;
+    private stderrTail: string[] = [];
+
+    constructor(
+        private scriptPath: string,
+        private serveArgs: string[],
+        private label: string
+    ) {}
+
+    private start(): ChildProcessWithoutNullStreams {
+        if (this.process) return this.process;
+
+        const child = spawn('python3', [this.scriptPath, ...this.serveArgs]);
+        this.process = child;
+        console.log(`🐍 [${this.label}] Sidecar Python avviato (pid ${child.pid})`);
+
+        readline.createInterface({ input: child.stdout }).on('line', (line: string) => {
+            let message: SidecarResponse;
+            try {
+                message = JSON.parse(line);
+            } catch {
+                console.error(`[${this.label}] Riga non valida dal sidecar:`, line);
+                return;
+            }
+            const request = this.pending.get(message.id);
+            if (!request) return;
+            clearTimeout(request.timer);
+            this.pending.delete(message.id);
+            request.resolve(message);
+        });
+
+        readline.createInterface({ input: child.stderr }).on('line', (line: string) => {
+            // Tiene solo le ultime righe di stderr da allegare agli errori
+            this.stderrTail.push(line);
+            if (this.stderrTail.length > 50) this.stderrTail.shift();
+        });
+
+        const onExit = (reason: string) => {
+            if (this.process !== child) return;
+            this.process = null;
+            console.warn(`⚠️ [${this.label}] Sidecar Python terminato: ${reason}`);
+            for (const [id, request] of this.pending) {
+                clearTimeout(request.timer);
+                request.reject(new SidecarUnavailableError(`Sidecar terminato (${reason}): ${this.stderrTail.join('\n')}`));
+                this.pending.delete(id);
+            }
+        };
+        child.on('exit', (code, signal) => onExit(`code ${code}, signal ${signal}`));
+        child.on('error', (err: Error) => onExit(err.message));
+
+        return child;
+    }
+
+    /**
+     * Invia al sidecar gli stessi argomenti che si passerebbero allo script da riga di comando.
+     */
+    request(argv: string[], timeoutMs = 60000): Promise<SidecarResponse> {
+        return new Promise((resolve, reject) => {
+            let child: ChildProcessWithoutNullStreams;
+            try {
+                child = this.start();
+            } catch (err) {
+                return reject(new SidecarUnavailableError((err as Error).message));
+            }
+            const id = this.nextId++;
+            const timer = setTimeout(() => {
+                this.pending.delete(id);
+                reject(new SidecarTimeoutError(`Timeout dopo ${timeoutMs}ms per ${argv.join(' ')}`));
+            }, timeoutMs);
+            this.pending.set(id, { resolve, reject, timer });
+            child.stdin.write(JSON.stringify({ id, argv }) + '\n');
+        });
+    }
+
+    stop(): void {
+        if (this.process) {
+            this.process.stdin.end();
+            this.process = null;
+        }
+    }
+}
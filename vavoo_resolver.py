@@ -4,18 +4,114 @@
 vavoo_resolver.py
 Script unico: dato il nome del canale, trova il link Vavoo e lo risolve in tempo reale.
 """
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import sys
-import requests
 import json
 import os
 import re
+import threading
+
+# Costo (ms) delle fasi di avvio e degli import pesanti, mostrato da --profile-startup
+STARTUP_PROFILE = {}
+
+# --- Helper comuni: identici in vavoo_resolver.py, animeunity_scraper.py e animesaturn.py.
+# La build copia ogni script da solo in dist/, quindi nessuno dei tre può importare un modulo condiviso:
+# una modifica qui va riportata anche negli altri due. ---
+
+def _timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    STARTUP_PROFILE[label] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+def startup_report():
+    """Tempi di avvio: inizializzazione del modulo e import/caricamenti effettivamente eseguiti"""
+    heavy = ("requests", "urllib3", "bs4", "charset_normalizer", "idna", "certifi")
+    return {
+        "phases_ms": STARTUP_PROFILE,
+        "heavy_modules_loaded": sorted(name for name in heavy if name in sys.modules),
+        "total_ms": round((time.perf_counter() - _STARTUP_T0) * 1000, 2),
+    }
+
+def handle_profile_startup(load_heavy_modules):
+    """
+    --profile-startup da solo carica tutti i moduli pesanti (load_heavy_modules) e stampa il report;
+    insieme a un comando riporta su stderr, all'uscita, cosa ha caricato quel comando
+    """
+    if "--profile-startup" not in sys.argv:
+        return
+    sys.argv.remove("--profile-startup")
+    STARTUP_PROFILE["module init"] = round((time.perf_counter() - _STARTUP_T0) * 1000, 2)
+    if len(sys.argv) == 1:
+        load_heavy_modules()
+        print(json.dumps(startup_report(), indent=2))
+        sys.exit(0)
+    import atexit
+    atexit.register(lambda: print(f"[STARTUP] {json.dumps(startup_report())}", file=sys.stderr))
 
-with open(os.path.join(os.path.dirname(__file__), 'config/domains.json'), encoding='utf-8') as f:
-    DOMAINS = json.load(f)
+def read_json_file(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """Scrive su un file temporaneo e poi rinomina, così chi legge non vede mai un file a metà"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+    os.replace(tmp_path, path)
+
+# --- Fine helper comuni ---
+
+def _load_domains():
+    with open(os.path.join(os.path.dirname(__file__), 'config/domains.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+DOMAINS = _timed("config/domains.json", _load_domains)
 
 VAVOO_DOMAIN = DOMAINS.get("vavoo")
 
-def getAuthSignature():
+# Sessione HTTP condivisa: riusa le connessioni keep-alive (soprattutto in modalità --serve).
+# requests viene importato solo alla prima richiesta di rete: i percorsi serviti dalla cache non lo caricano.
+POOL_SIZE = int(os.environ.get("VAVOO_POOL_SIZE", "16"))
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import importlib
+            requests = _timed("import requests", lambda: importlib.import_module("requests"))
+            session = requests.Session()
+            session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+            _session = session
+        return _session
+
+# Gruppi del catalogo da scaricare (es. VAVOO_GROUPS="Italy,Germany")
+CATALOG_GROUPS = [g.strip() for g in os.environ.get("VAVOO_GROUPS", "Italy").split(",") if g.strip()]
+
+# Directory per i file di cache condivisi tra le invocazioni
+CACHE_DIR = os.environ.get("VAVOO_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+
+# Cache della signature addonSig: TTL in secondi, rinnovata in background quando manca meno di SIGNATURE_REFRESH_AHEAD
+SIGNATURE_CACHE_FILE = os.path.join(CACHE_DIR, "vavoo_signature.json")
+SIGNATURE_TTL = int(os.environ.get("VAVOO_SIGNATURE_TTL", "600"))
+SIGNATURE_REFRESH_AHEAD = int(os.environ.get("VAVOO_SIGNATURE_REFRESH_AHEAD", str(SIGNATURE_TTL // 5)))
+
+_signature_lock = threading.Lock()
+# Serializza le richieste a vavoo.tv: chi trova la cache vuota mentre un'altra richiesta è in corso la aspetta
+_signature_fetch_lock = threading.Lock()
+_signature_cache = {"signature": None, "fetched_at": 0}
+_signature_refreshing = False
+
+def fetch_auth_signature():
     """Funzione che replica esattamente quella dell'addon utils.py"""
     headers = {
         "user-agent": "okhttp/4.11.0",
@@ -84,19 +180,126 @@ def getAuthSignature():
     }
     try:
         # Usa sempre il dominio ufficiale per la signature!
-        resp = requests.post("https://www.vavoo.tv/api/app/ping", json=data, headers=headers, timeout=10)
+        resp = get_session().post("https://www.vavoo.tv/api/app/ping", json=data, headers=headers, timeout=10)
         resp.raise_for_status()
         return resp.json().get("addonSig")
     except Exception as e:
         print(f"Errore nel recupero della signature: {e}", file=sys.stderr)
         return None
 
-def get_channels():
+def _store_signature(signature):
+    with _signature_lock:
+        _signature_cache["signature"] = signature
+        _signature_cache["fetched_at"] = time.time()
+        entry = dict(_signature_cache)
+    try:
+        write_json_atomic(SIGNATURE_CACHE_FILE, entry)
+    except OSError as e:
+        print(f"[DEBUG] Impossibile salvare la signature su disco: {e}", file=sys.stderr)
+
+def _fetch_signature_once(requested_at):
+    """
+    Richiede una nuova signature, una sola richiesta alla volta. Se nel frattempo un altro
+    thread ne ha salvata una più recente di requested_at, restituisce quella senza rifare il ping.
+    """
+    with _signature_fetch_lock:
+        with _signature_lock:
+            if _signature_cache["signature"] and _signature_cache["fetched_at"] >= requested_at:
+                return _signature_cache["signature"]
+        signature = fetch_auth_signature()
+        if signature:
+            _store_signature(signature)
+        return signature
+
+def _refresh_signature_in_background():
+    global _signature_refreshing
+    with _signature_lock:
+        if _signature_refreshing:
+            return
+        _signature_refreshing = True
+
+    def worker():
+        global _signature_refreshing
+        try:
+            _fetch_signature_once(time.time())
+        finally:
+            with _signature_lock:
+                _signature_refreshing = False
+
+    threading.Thread(target=worker, daemon=True).start()
+
+def invalidate_signature():
+    """Scarta la signature in cache (es. dopo un rifiuto del server)"""
+    with _signature_lock:
+        _signature_cache["signature"] = None
+        _signature_cache["fetched_at"] = 0
+    try:
+        os.remove(SIGNATURE_CACHE_FILE)
+    except OSError:
+        pass
+
+def getAuthSignature(force_refresh=False):
+    """Restituisce addonSig dalla cache (memoria, poi disco); la richiede a vavoo.tv solo se scaduta"""
+    now = time.time()
+    if not force_refresh:
+        with _signature_lock:
+            entry = dict(_signature_cache)
+        if not entry["signature"]:
+            entry = read_json_file(SIGNATURE_CACHE_FILE) or entry
+            if entry.get("signature"):
+                with _signature_lock:
+                    _signature_cache.update(signature=entry["signature"], fetched_at=entry.get("fetched_at", 0))
+        signature = entry.get("signature")
+        age = now - entry.get("fetched_at", 0)
+        if signature and age < SIGNATURE_TTL:
+            if age >= SIGNATURE_TTL - SIGNATURE_REFRESH_AHEAD:
+                _refresh_signature_in_background()
+            return signature
+
+    return _fetch_signature_once(now)
+
+def _fetch_group_pages(group, headers):
+    """Scorre le pagine di un gruppo: ogni richiesta parte appena il nextCursor precedente è noto"""
+    cursor = 0
+    while True:
+        data = {
+            "language": "de",
+            "region": "AT",
+            "catalogId": "iptv",
+            "id": "iptv",
+            "adult": False,
+            "search": "",
+            "sort": "name",
+            "filter": {"group": group},
+            "cursor": cursor,
+            "clientVersion": "3.0.2"
+        }
+        try:
+            resp = get_session().post(f"https://{VAVOO_DOMAIN}/mediahubmx-catalog.json", json=data, headers=headers, timeout=10)
+            resp.raise_for_status()
+            r = resp.json()
+        except Exception as e:
+            print(f"[DEBUG] Error getting channels ({group}): {e}", file=sys.stderr)
+            return
+        yield r.get("items", [])
+        cursor = r.get("nextCursor")
+        if not cursor:
+            return
+
+def iter_catalog_pages(groups=None):
+    """
+    Scarica i gruppi in parallelo sulla sessione condivisa e restituisce (gruppo, canali)
+    per ogni pagina, nell'ordine in cui arrivano.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import queue
+
+    groups = groups or CATALOG_GROUPS
     signature = getAuthSignature()
     if not signature:
         print("[DEBUG] Failed to get signature for channels", file=sys.stderr)
-        return []
-    
+        return
+
     headers = {
         "user-agent": "okhttp/4.11.0",
         "accept": "application/json",
@@ -104,122 +307,315 @@ def get_channels():
         "accept-encoding": "gzip",
         "mediahubmx-signature": signature
     }
+    pages = queue.Queue()
+    done = object()
+
+    def fetch_group(group):
+        try:
+            for items in _fetch_group_pages(group, headers):
+                pages.put((group, items))
+        finally:
+            pages.put(done)
+
+    with ThreadPoolExecutor(max_workers=min(len(groups), POOL_SIZE)) as pool:
+        for group in groups:
+            pool.submit(fetch_group, group)
+        remaining = len(groups)
+        while remaining:
+            page = pages.get()
+            if page is done:
+                remaining -= 1
+                continue
+            yield page
+
+def get_channels(groups=None):
+    """Catalogo completo; i canali restano ordinati secondo l'ordine dei gruppi configurati"""
+    groups = groups or CATALOG_GROUPS
+    by_group = {group: [] for group in groups}
+    for group, items in iter_catalog_pages(groups):
+        by_group[group].extend(items)
     all_channels = []
-    # Lista dei gruppi da controllare per i canali TV
-    groups = ["Italy"]
     for group in groups:
-        cursor = 0
-        while True:
-            data = {
-                "language": "de",
-                "region": "AT",
-                "catalogId": "iptv",
-                "id": "iptv",
-                "adult": False,
-                "search": "",
-                "sort": "name",
-                "filter": {"group": group},
-                "cursor": cursor,
-                "clientVersion": "3.0.2"
-            }
-            try:
-                resp = requests.post(f"https://{VAVOO_DOMAIN}/mediahubmx-catalog.json", json=data, headers=headers, timeout=10)
-                resp.raise_for_status()
-                r = resp.json()
-                items = r.get("items", [])
-                all_channels.extend(items)
-                cursor = r.get("nextCursor")
-                if not cursor:
-                    break
-            except Exception as e:
-                print(f"[DEBUG] Error getting channels: {e}", file=sys.stderr)
-                break
+        all_channels.extend(by_group[group])
     return all_channels
 
-def resolve_vavoo_link(link):
-    signature = getAuthSignature()
-    if not signature:
-        print("[DEBUG] Failed to get signature for resolution", file=sys.stderr)
+class SignatureError(Exception):
+    pass
+
+def post_resolve(link):
+    """
+    Chiama mediahubmx-resolve.json con la signature in cache.
+    Se il server rifiuta la signature (401/403) la rinnova e riprova una sola volta.
+    """
+    for attempt in range(2):
+        signature = getAuthSignature(force_refresh=attempt > 0)
+        if not signature:
+            raise SignatureError("signature non disponibile")
+        headers = {
+            "user-agent": "MediaHubMX/2",
+            "accept": "application/json",
+            "content-type": "application/json; charset=utf-8",
+            "content-length": "115",
+            "accept-encoding": "gzip",
+            "mediahubmx-signature": signature
+        }
+        data = {
+            "language": "de",
+            "region": "AT",
+            "url": link,
+            "clientVersion": "3.0.2"
+        }
+        resp = get_session().post(f"https://{VAVOO_DOMAIN}/mediahubmx-resolve.json", json=data, headers=headers, timeout=10)
+        if resp.status_code in (401, 403) and attempt == 0:
+            print(f"[DEBUG] Signature rifiutata ({resp.status_code}), la rinnovo e riprovo", file=sys.stderr)
+            invalidate_signature()
+            continue
+        resp.raise_for_status()
+        return resp.json()
+
+def extract_resolved_url(result):
+    if isinstance(result, list) and result and result[0].get("url"):
+        return result[0]["url"]
+    elif isinstance(result, dict) and result.get("url"):
+        return result["url"]
+    return None
+
+# Cache dei link risolti, chiave = link /play/ originale.
+# La scadenza viene letta dal token/expiry nell'URL risolto, altrimenti si usa RESOLVED_DEFAULT_TTL.
+# Negli ultimi RESOLVED_STALE_WINDOW secondi di validità il link viene restituito subito e rinnovato in background.
+RESOLVED_CACHE_FILE = os.path.join(CACHE_DIR, "vavoo_resolved.json")
+RESOLVED_DEFAULT_TTL = int(os.environ.get("VAVOO_RESOLVED_TTL", "300"))
+RESOLVED_STALE_WINDOW = int(os.environ.get("VAVOO_RESOLVED_STALE_WINDOW", "60"))
+RESOLVED_EXPIRY_MARGIN = int(os.environ.get("VAVOO_RESOLVED_EXPIRY_MARGIN", "30"))
+EXPIRY_PARAMS = ("expires", "expire", "expiry", "exp", "e", "valid_until", "validto")
+
+_resolved_lock = threading.Lock()
+_resolved_cache = {}
+_resolved_loaded = False
+_resolved_refreshing = set()
+# Contatori del processo corrente; vengono sommati a quelli su disco a ogni salvataggio
+RESOLVED_STATS = {"hits": 0, "stale_hits": 0, "misses": 0, "expired": 0, "refreshes": 0}
+_resolved_stats_pending = dict.fromkeys(RESOLVED_STATS, 0)
+# Richieste per link (usate dal pre-warm per scegliere i canali più visti)
+_resolved_hits_pending = {}
+
+def _epoch_seconds(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
         return None
-        
-    headers = {
-        "user-agent": "MediaHubMX/2",
-        "accept": "application/json",
-        "content-type": "application/json; charset=utf-8",
-        "content-length": "115",
-        "accept-encoding": "gzip",
-        "mediahubmx-signature": signature
-    }
-    data = {
-        "language": "de",
-        "region": "AT",
-        "url": link,
-        "clientVersion": "3.0.2"
+    if number > 1e12:  # millisecondi
+        number /= 1000
+    # Accetta solo timestamp plausibili (dal 2020 in poi)
+    return number if number > 1577836800 else None
+
+def _jwt_expiry(token):
+    import base64
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        return _epoch_seconds(json.loads(base64.urlsafe_b64decode(payload)).get("exp"))
+    except Exception:
+        return None
+
+def resolved_url_expiry(url):
+    """Scadenza (epoch) letta dai parametri dell'URL risolto, o None se non presente"""
+    from urllib.parse import urlparse, parse_qsl
+    params = parse_qsl(urlparse(url).query)
+    for key, value in params:
+        if key.lower() in EXPIRY_PARAMS:
+            expiry = _epoch_seconds(value)
+            if expiry:
+                return expiry
+    for key, value in params:
+        if "token" in key.lower():
+            expiry = _jwt_expiry(value)
+            if expiry:
+                return expiry
+    return None
+
+def _count(stat):
+    with _resolved_lock:
+        RESOLVED_STATS[stat] += 1
+        _resolved_stats_pending[stat] += 1
+
+def _load_resolved_cache():
+    global _resolved_loaded
+    with _resolved_lock:
+        if _resolved_loaded:
+            return
+        data = read_json_file(RESOLVED_CACHE_FILE) or {}
+        _resolved_cache.update(data.get("entries", {}))
+        _resolved_loaded = True
+    # I contatori dei cache hit (che non riscrivono il file) vengono salvati all'uscita
+    import atexit
+    atexit.register(_flush_resolved_counters)
+
+def _flush_resolved_counters():
+    if any(_resolved_stats_pending.values()) or _resolved_hits_pending:
+        _save_resolved_cache()
+
+def _save_resolved_cache():
+    now = time.time()
+    with _resolved_lock:
+        data = read_json_file(RESOLVED_CACHE_FILE) or {}
+        entries = data.get("entries", {})
+        # Unisce le voci scritte da altri processi, tenendo la più recente
+        for link, entry in _resolved_cache.items():
+            if entry.get("resolved_at", 0) >= entries.get(link, {}).get("resolved_at", 0):
+                entries[link] = entry
+        entries = {link: e for link, e in entries.items() if e.get("stale_until", 0) > now}
+        stats = data.get("stats", {})
+        for key, delta in _resolved_stats_pending.items():
+            stats[key] = stats.get(key, 0) + delta
+            _resolved_stats_pending[key] = 0
+        hits = data.get("hits", {})
+        for link, delta in _resolved_hits_pending.items():
+            hits[link] = hits.get(link, 0) + delta
+        _resolved_hits_pending.clear()
+        _resolved_cache.clear()
+        _resolved_cache.update(entries)
+        try:
+            write_json_atomic(RESOLVED_CACHE_FILE, {"entries": entries, "stats": stats, "hits": hits})
+        except OSError as e:
+            print(f"[DEBUG] Impossibile salvare la cache dei link risolti: {e}", file=sys.stderr)
+
+def _store_resolved(link, url):
+    now = time.time()
+    expiry = resolved_url_expiry(url)
+    if expiry:
+        stale_until = expiry - RESOLVED_EXPIRY_MARGIN
+        fresh_until = stale_until - RESOLVED_STALE_WINDOW
+    else:
+        fresh_until = now + RESOLVED_DEFAULT_TTL
+        stale_until = fresh_until + RESOLVED_STALE_WINDOW
+    if stale_until <= now:
+        return
+    with _resolved_lock:
+        _resolved_cache[link] = {
+            "url": url,
+            "resolved_at": now,
+            "fresh_until": fresh_until,
+            "stale_until": stale_until,
+        }
+    _save_resolved_cache()
+
+def _revalidate_in_background(link, fetch):
+    with _resolved_lock:
+        if link in _resolved_refreshing:
+            return
+        _resolved_refreshing.add(link)
+
+    def worker():
+        try:
+            url = fetch(link)
+            if url:
+                _count("refreshes")
+                _store_resolved(link, url)
+        finally:
+            with _resolved_lock:
+                _resolved_refreshing.discard(link)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+def resolve_with_cache(link, fetch):
+    """Restituisce il link risolto dalla cache se valido; altrimenti chiama fetch(link) e lo salva"""
+    _load_resolved_cache()
+    now = time.time()
+    with _resolved_lock:
+        entry = _resolved_cache.get(link)
+        _resolved_hits_pending[link] = _resolved_hits_pending.get(link, 0) + 1
+    if entry:
+        if now < entry["fresh_until"]:
+            _count("hits")
+            print(f"[DEBUG] Link risolto dalla cache (valido ancora {int(entry['fresh_until'] - now)}s)", file=sys.stderr)
+            return entry["url"]
+        if now < entry["stale_until"]:
+            _count("stale_hits")
+            print("[DEBUG] Link risolto dalla cache in scadenza, rinnovo in background", file=sys.stderr)
+            _revalidate_in_background(link, fetch)
+            return entry["url"]
+        _count("expired")
+    _count("misses")
+    url = fetch(link)
+    if url:
+        _store_resolved(link, url)
+    return url
+
+def resolved_cache_stats():
+    """Contatori cumulativi (disco + processo corrente) e numero di voci valide"""
+    _save_resolved_cache()
+    data = read_json_file(RESOLVED_CACHE_FILE) or {}
+    now = time.time()
+    entries = data.get("entries", {})
+    return {
+        "entries": len(entries),
+        "fresh": sum(1 for e in entries.values() if e.get("fresh_until", 0) > now),
+        "stats": data.get("stats", {}),
+        "process_stats": dict(RESOLVED_STATS),
     }
+
+def fetch_resolved_link(link):
     try:
-        resp = requests.post(f"https://{VAVOO_DOMAIN}/mediahubmx-resolve.json", json=data, headers=headers, timeout=10)
-        resp.raise_for_status()
-        result = resp.json()
-        if isinstance(result, list) and result and result[0].get("url"):
-            return result[0]["url"]
-        elif isinstance(result, dict) and result.get("url"):
-            return result["url"]
-        else:
-            print(f"[DEBUG] Unexpected response format: {result}", file=sys.stderr)
-            return None
+        result = post_resolve(link)
+    except SignatureError:
+        print("[DEBUG] Failed to get signature for resolution", file=sys.stderr)
+        return None
     except Exception as e:
         print(f"[DEBUG] Error resolving link: {e}", file=sys.stderr)
         return None
+    url = extract_resolved_url(result)
+    if not url:
+        print(f"[DEBUG] Unexpected response format: {result}", file=sys.stderr)
+    return url
+
+def resolve_vavoo_link(link):
+    return resolve_with_cache(link, fetch_resolved_link)
+
+VARIANT_SUFFIX_RE = re.compile(r'\s+\.[a-zA-Z]$')
+QUALITY_SUFFIX_RE = re.compile(r'\s+(HD|FHD|4K)$')
+NON_ALNUM_RE = re.compile(r'[^A-Z0-9]')
 
 def normalize_vavoo_name(name):
     # Rimuove suffisso tipo ' .c', ' .a', ' .b' alla fine
     name = name.strip()
-    name = re.sub(r'\s+\.[a-zA-Z]$', '', name)
+    name = VARIANT_SUFFIX_RE.sub('', name)
     return name.upper()
 
-def resolve_direct_link(link):
-    """Risolve direttamente un link Vavoo (come vavoofunzionante.py)"""
-    if not "vavoo" in link:
-        print("[DEBUG] Il link non sembra essere un link Vavoo", file=sys.stderr)
-        return None
-        
-    signature = getAuthSignature()
-    if not signature:
+def clean_vavoo_name(name):
+    """Nome senza suffisso di variante né suffisso di qualità (HD, FHD, 4K)"""
+    clean_name = VARIANT_SUFFIX_RE.sub('', name.strip().upper())
+    return QUALITY_SUFFIX_RE.sub('', clean_name)
+
+def simplify_vavoo_name(name):
+    """Solo lettere e cifre, per il matching flessibile"""
+    return NON_ALNUM_RE.sub('', name.strip().upper())
+
+def fetch_direct_link(link):
+    try:
+        result = post_resolve(link)
+    except SignatureError:
         print("[DEBUG] Failed to get signature for direct resolution", file=sys.stderr)
         return None
-        
-    headers = {
-        "user-agent": "MediaHubMX/2",
-        "accept": "application/json",
-        "content-type": "application/json; charset=utf-8",
-        "content-length": "115",
-        "accept-encoding": "gzip",
-        "mediahubmx-signature": signature
-    }
-    data = {
-        "language": "de",
-        "region": "AT",
-        "url": link,
-        "clientVersion": "3.0.2"
-    }
-    try:
-        resp = requests.post(f"https://{VAVOO_DOMAIN}/mediahubmx-resolve.json", json=data, headers=headers, timeout=10)
-        resp.raise_for_status()
-        result = resp.json()
-        
-        print(f"[DEBUG] Direct resolution response: {result}", file=sys.stderr)
-        
-        if isinstance(result, list) and result and result[0].get("url"):
-            return result[0]["url"]
-        elif isinstance(result, dict) and result.get("url"):
-            return result["url"]
-        else:
-            print(f"[DEBUG] Unexpected response format in direct resolution: {result}", file=sys.stderr)
-            return None
     except Exception as e:
         print(f"[DEBUG] Error in direct resolution: {e}", file=sys.stderr)
         return None
 
+    print(f"[DEBUG] Direct resolution response: {result}", file=sys.stderr)
+    url = extract_resolved_url(result)
+    if not url:
+        print(f"[DEBUG] Unexpected response format in direct resolution: {result}", file=sys.stderr)
+    return url
+
+def resolve_direct_link(link):
+    """Risolve direttamente un link Vavoo (come vavoofunzionante.py)"""
+    if not "vavoo" in link:
+        print("[DEBUG] Il link non sembra essere un link Vavoo", file=sys.stderr)
+        return None
+    return resolve_with_cache(link, fetch_direct_link)
+
 def build_vavoo_cache(channels):
     cache = {}
     for ch in channels:
@@ -231,136 +627,780 @@ def build_vavoo_cache(channels):
         cache[name] = url
     return cache
 
+FUZZY_MIN_SCORE = float(os.environ.get("VAVOO_FUZZY_MIN_SCORE", "0.35"))
+# Da incrementare quando cambia il modo di costruire l'indice: le cache salvate con una versione diversa vengono ricostruite
+CHANNEL_INDEX_VERSION = 2
+
+def build_channel_index(names):
+    """
+    Indice dei nomi canale, calcolato una volta sola (e salvato in vavoo_cache.json):
+    - exact:   nome normalizzato -> varianti
+    - clean:   [nome senza suffissi, varianti] nell'ordine del catalogo (base dell'indice a trigrammi)
+    - mapping: nome di config/tv_channels.json -> varianti, risolto con il fuzzy una volta sola
+    """
+    exact = {}
+    clean = {}
+    for name in names:
+        exact.setdefault(normalize_vavoo_name(name), []).append(name)
+        clean.setdefault(clean_vavoo_name(name), []).append(name)
+    index = {
+        "version": CHANNEL_INDEX_VERSION,
+        "exact": exact,
+        "clean": [[key, variants] for key, variants in clean.items()],
+    }
+    index["mapping"] = build_name_mapping(index)
+    return index
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+_fuzzy_lock = threading.Lock()
+_fuzzy_memo = {"index": None, "postings": None, "sizes": None}
+
+def _fuzzy_postings(index):
+    """Trigramma -> posizioni in index["clean"]; costruito in memoria una volta per indice"""
+    with _fuzzy_lock:
+        if _fuzzy_memo["index"] is not index:
+            postings = {}
+            sizes = []
+            for position, (key, _variants) in enumerate(index["clean"]):
+                grams = trigrams(simplify_vavoo_name(key))
+                sizes.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(position)
+            _fuzzy_memo.update(index=index, postings=postings, sizes=sizes)
+        return _fuzzy_memo["postings"], _fuzzy_memo["sizes"]
+
+def names_overlap(wanted, key):
+    """
+    Vero se un nome contiene l'altro: come sottostringa (anche senza spazi e simboli, come i
+    vecchi passaggi parziale/flessibile) o come insieme di parole. I trigrammi in comune da
+    soli non bastano: "SKY CRIME" e "TOP CRIME" condividono una parola ma sono canali diversi.
+    """
+    if not key or not wanted:
+        return False
+    if wanted in key or key in wanted:
+        return True
+    wanted_simple, key_simple = simplify_vavoo_name(wanted), simplify_vavoo_name(key)
+    if wanted_simple and key_simple and (wanted_simple in key_simple or key_simple in wanted_simple):
+        return True
+    wanted_words, key_words = set(wanted.split()), set(key.split())
+    return bool(wanted_words) and bool(key_words) and (wanted_words <= key_words or key_words <= wanted_words)
+
+def fuzzy_candidates(index, wanted, limit=5, min_score=None, require_overlap=True):
+    """
+    Candidati ordinati per somiglianza (coefficiente di Dice sui trigrammi dei nomi alfanumerici,
+    con un bonus se un nome contiene l'altro). Restituisce [(nome pulito, varianti, punteggio)].
+    Con require_overlap (default) sono ammessi solo i nomi che passano names_overlap.
+    """
+    min_score = FUZZY_MIN_SCORE if min_score is None else min_score
+    postings, sizes = _fuzzy_postings(index)
+    wanted_grams = trigrams(simplify_vavoo_name(wanted))
+    shared = {}
+    for gram in wanted_grams:
+        for position in postings.get(gram, ()):
+            shared[position] = shared.get(position, 0) + 1
+
+    scored = []
+    for position, count in shared.items():
+        key = index["clean"][position][0]
+        if require_overlap and not names_overlap(wanted, key):
+            continue
+        score = 2 * count / (len(wanted_grams) + sizes[position])
+        if key and (wanted in key or key in wanted):
+            score = 0.2 + 0.8 * score
+        if score >= min_score:
+            scored.append((score, position))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [(index["clean"][p][0], index["clean"][p][1], round(score, 3)) for score, p in scored[:limit]]
+
+def build_name_mapping(index):
+    """Associa i nomi di config/tv_channels.json che non hanno un match esatto al miglior candidato fuzzy"""
+    mapping = {}
+    for channel in read_json_file(TV_CHANNELS_FILE) or []:
+        for name in (channel.get("vavooNames") or []) + [channel.get("name", "")]:
+            key = normalize_vavoo_name(name)
+            if not key or key in mapping or key in index["exact"]:
+                continue
+            candidates = fuzzy_candidates(index, key, limit=1)
+            if candidates:
+                mapping[key] = candidates[0][1]
+    return mapping
+
+# Nomi con l'esito atteso sulla cache distribuita: None = deve restare NOT_FOUND
+MATCHING_CHECKS = {
+    "BOOMERANG": None,
+    "SKY CRIME": None,
+    "SKY ADVENTURE": None,
+    "SKY INVESTIGATION": None,
+    "FOO BAR": None,
+    "LA7": "LA 7",
+    "SKY TG24": "SKY TG 24",
+    "SKY SPORT 251": "SKY SPORT",
+}
+
+def check_matching(catalog=None):
+    """
+    Verifica MATCHING_CHECKS e che ogni voce del mapping passi names_overlap.
+    Restituisce la lista degli errori (vuota se è tutto a posto).
+    """
+    catalog = catalog or load_catalog()
+    if not catalog:
+        return [f"{VAVOO_CACHE_FILE} mancante o vuoto"]
+    index = catalog["index"]
+    errors = []
+    for name, expected in MATCHING_CHECKS.items():
+        variants = search_channel_index(index, normalize_vavoo_name(name))
+        found = clean_vavoo_name(variants[0]) if variants else None
+        if found != expected:
+            errors.append(f"{name}: atteso {expected}, trovato {found}")
+    for name, variants in index.get("mapping", {}).items():
+        if not names_overlap(name, clean_vavoo_name(variants[0])):
+            errors.append(f"mapping {name} -> {variants[0]}: i nomi non si contengono")
+    return errors
+
+def search_channel_index(index, wanted):
+    """
+    Cerca nell'indice: esatto (O(1)), poi tabella dei nomi di tv_channels.json (O(1)),
+    infine il candidato fuzzy con punteggio più alto. Restituisce le varianti o None.
+    """
+    variants = index["exact"].get(wanted)
+    if variants:
+        print(f"[DEBUG] Found exact match: {variants[0]}", file=sys.stderr)
+        return variants
+
+    variants = index.get("mapping", {}).get(wanted)
+    if variants:
+        print(f"[DEBUG] Found mapped match: {variants[0]}", file=sys.stderr)
+        return variants
+
+    candidates = fuzzy_candidates(index, wanted, limit=1)
+    if candidates:
+        clean_name, variants, score = candidates[0]
+        print(f"[DEBUG] Found fuzzy match: {variants[0]} (cleaned: {clean_name}, score: {score})", file=sys.stderr)
+        return variants
+
+    return None
+
+VAVOO_CACHE_FILE = os.environ.get("VAVOO_CACHE_FILE", "vavoo_cache.json")
+
+_catalog_lock = threading.Lock()
+_catalog_memo = {"mtime": None, "catalog": None}
+
+def catalog_from_channels(channels):
+    """Catalogo (link + indice) costruito da una lista di canali appena scaricata"""
+    links = {}
+    for ch in channels:
+        name = ch.get("name", "").strip()
+        if name and name not in links:
+            links[name] = ch.get("url", "")
+    return {"links": links, "index": build_channel_index(links), "source": "live"}
+
+def load_catalog():
+    """
+    Catalogo letto da vavoo_cache.json (senza scaricare nulla).
+    Viene ricaricato solo se il file cambia; se manca l'indice lo ricostruisce dai link.
+    """
+    try:
+        mtime = os.path.getmtime(VAVOO_CACHE_FILE)
+    except OSError:
+        return None
+    with _catalog_lock:
+        if _catalog_memo["mtime"] == mtime:
+            return _catalog_memo["catalog"]
+    data = read_json_file(VAVOO_CACHE_FILE)
+    if not data or not data.get("links"):
+        return None
+    links = data["links"]
+    index = data.get("index")
+    if not index or index.get("version") != CHANNEL_INDEX_VERSION:
+        # Cache di una versione precedente (es. mapping con match fuzzy errati): ricostruisce l'indice completo
+        index = build_channel_index(links)
+    catalog = {"links": links, "index": index, "source": "cache"}
+    with _catalog_lock:
+        _catalog_memo.update(mtime=mtime, catalog=catalog)
+    return catalog
+
 def mostra_debug_cache():
     import json
     try:
-        with open('vavoo_cache.json', encoding='utf-8') as f:
+        with open(VAVOO_CACHE_FILE, encoding='utf-8') as f:
             cache = json.load(f)
         return json.dumps(cache, indent=2, ensure_ascii=False)
     except Exception as e:
         return f"Errore nella lettura della cache: {e}"
 
-# Esegui con: python3 vavoo_resolver.py --build-cache
-if "--build-cache" in sys.argv:
-    channels = get_channels()
-    cache = build_vavoo_cache(channels)
-    with open("vavoo_cache.json", "w", encoding="utf-8") as f:
-        json.dump({"links": cache}, f, ensure_ascii=False, indent=2)
-    print("Cache Vavoo generata con successo!")
-    # RIMOSSO: stampa debug dettagliata
-    sys.exit(0)
 
-if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 2:
-        print("Usage: python3 vavoo_resolver.py <channel_name_or_vavoo_link> [--original-link] [--dump-channels]", file=sys.stderr)
-        sys.exit(1)
-    
-    # Controllo se l'opzione per dump dei canali è presente
-    if "--dump-channels" in sys.argv:
-        channels = get_channels()
-        # Aggiungi alias ai canali per un miglior matching
-        for ch in channels:
-            if "name" in ch:
-                ch["aliases"] = [
-                    ch["name"].replace(" HD", "").replace(" FHD", "").replace(" 4K", ""),  # Versione senza qualità
-                    re.sub(r'\.[a-zA-Z]$', '', ch["name"]),  # Senza suffisso .a, .b, ecc
-                ]
-        print(json.dumps(channels))
-        sys.exit(0)
-        
-    input_arg = sys.argv[1]
-    return_original_link = "--original-link" in sys.argv
-    
+# Codici di uscita usati dal CLI (e restituiti nel campo "code" in modalità --serve)
+EXIT_USAGE = 1
+EXIT_NOT_FOUND = 2
+EXIT_NO_URL = 3
+EXIT_RESOLVE_FAIL = 4
+EXIT_ERROR = 5
+
+STATUS_NAMES = {
+    EXIT_NOT_FOUND: "NOT_FOUND",
+    EXIT_NO_URL: "NO_URL",
+    EXIT_RESOLVE_FAIL: "RESOLVE_FAIL",
+    EXIT_ERROR: "ERROR",
+}
+
+USAGE = "Usage: python3 vavoo_resolver.py <channel_name_or_vavoo_link> [--original-link] [--dump-channels [--ndjson]] [--build-cache] [--cache-stats] [--serve] [--batch [--workers N] < channels.txt] [--prewarm [--interval S] [--limit N] [--hits FILE]] [--probe [names...]] [--match NAME] [--check-matching] [--profile-startup]"
+
+# Classifica delle varianti di un canale per tempo al primo byte dello stream
+RANKING_FILE = os.path.join(CACHE_DIR, "vavoo_ranking.json")
+PROBE_TIMEOUT = float(os.environ.get("VAVOO_PROBE_TIMEOUT", "5"))
+PROBE_WORKERS = int(os.environ.get("VAVOO_PROBE_WORKERS", "8"))
+
+_ranking_lock = threading.Lock()
+_ranking_memo = {"mtime": None, "variants": {}}
+
+def load_ranking():
+    """Misure per variante: {nome: {"ttfb": secondi, "ok": bool, "probed_at": epoch}}"""
+    try:
+        mtime = os.path.getmtime(RANKING_FILE)
+    except OSError:
+        return {}
+    with _ranking_lock:
+        if _ranking_memo["mtime"] != mtime:
+            data = read_json_file(RANKING_FILE) or {}
+            _ranking_memo.update(mtime=mtime, variants=data.get("variants", {}))
+        return _ranking_memo["variants"]
+
+def rank_variants(variants):
+    """
+    Ordina le varianti: prima quelle sane per ttfb crescente, poi quelle mai misurate
+    (nell'ordine del catalogo), infine quelle che hanno fallito l'ultima prova.
+    """
+    ranking = load_ranking()
+
+    def sort_key(item):
+        position, name = item
+        probe = ranking.get(name)
+        if not probe:
+            return (1, 0, position)
+        if not probe.get("ok"):
+            return (2, 0, position)
+        return (0, probe.get("ttfb", PROBE_TIMEOUT), position)
+
+    return [name for _, name in sorted(enumerate(variants), key=sort_key)]
+
+def probe_stream(url):
+    """Tempo al primo byte del manifest/stream risolto; None se non risponde o risponde con errore"""
+    start = time.time()
+    try:
+        with get_session().get(url, headers={"user-agent": "MediaHubMX/2"}, stream=True, timeout=PROBE_TIMEOUT) as resp:
+            if resp.status_code >= 400:
+                return None
+            next(resp.iter_content(chunk_size=1024), None)
+            return time.time() - start
+    except Exception as e:
+        print(f"[DEBUG] Probe fallito per {url[:60]}: {e}", file=sys.stderr)
+        return None
+
+def probe_variant(name, link):
+    start = time.time()
+    resolved = resolve_vavoo_link(link) if link else None
+    ttfb = probe_stream(resolved) if resolved else None
+    return name, {
+        "ok": ttfb is not None,
+        "ttfb": round(ttfb, 3) if ttfb is not None else None,
+        "resolve_time": round(time.time() - start, 3),
+        "probed_at": time.time(),
+    }
+
+def probe_channels(names, catalog=None, workers=PROBE_WORKERS):
+    """
+    Risolve e misura in parallelo tutte le varianti dei canali indicati, poi salva la classifica.
+    Restituisce {nome canale: [varianti ordinate con le misure]}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    catalog = catalog or load_catalog() or catalog_from_channels(get_channels())
+    groups = {}
+    for name in names:
+        variants = search_channel_index(catalog["index"], normalize_vavoo_name(name))
+        if variants:
+            groups[name] = variants
+
+    todo = {variant for variants in groups.values() for variant in variants}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        measured = dict(pool.map(lambda variant: probe_variant(variant, catalog["links"].get(variant)), todo))
+
+    with _ranking_lock:
+        data = read_json_file(RANKING_FILE) or {}
+        variants_data = data.get("variants", {})
+        variants_data.update(measured)
+        try:
+            write_json_atomic(RANKING_FILE, {"variants": variants_data})
+        except OSError as e:
+            print(f"[DEBUG] Impossibile salvare la classifica delle varianti: {e}", file=sys.stderr)
+
+    return {
+        name: [dict(measured[variant], name=variant) for variant in rank_variants(variants)]
+        for name, variants in groups.items()
+    }
+
+# Hedging: se la variante principale non risponde entro HEDGE_DELAY secondi partono in parallelo le alternative
+HEDGE_ENABLED = os.environ.get("VAVOO_HEDGE", "1") != "0"
+HEDGE_DELAY = float(os.environ.get("VAVOO_HEDGE_DELAY", "1.5"))
+HEDGE_MAX_ALTERNATIVES = int(os.environ.get("VAVOO_HEDGE_MAX_ALTERNATIVES", "3"))
+
+def hedged_resolve(links, delay=None, enabled=None):
+    """
+    Risolve links[0]; se non risponde entro delay secondi (o fallisce) risolve in parallelo
+    le alternative e restituisce il primo URL valido. Le risoluzioni ancora in corso vengono
+    abbandonate: girano su thread daemon e, se terminano, aggiornano solo la cache.
+    Con enabled=False (o VAVOO_HEDGE=0) prova le varianti una alla volta sul thread chiamante.
+    """
+    import queue
+
+    delay = HEDGE_DELAY if delay is None else delay
+    enabled = HEDGE_ENABLED if enabled is None else enabled
+    alternatives = links[1:1 + HEDGE_MAX_ALTERNATIVES]
+    if not enabled or not alternatives:
+        for link in links[:1] + alternatives:
+            resolved = resolve_vavoo_link(link)
+            if resolved:
+                return resolved
+        return None
+
+    results = queue.Queue()
+
+    def start(link):
+        threading.Thread(target=lambda: results.put((link, resolve_vavoo_link(link))), daemon=True).start()
+
+    start(links[0])
+    pending = 1
+    hedged = False
+    while pending:
+        try:
+            link, resolved = results.get(timeout=None if hedged else delay)
+        except queue.Empty:
+            print(f"[DEBUG] Nessuna risposta entro {delay}s, provo {len(alternatives)} varianti in parallelo", file=sys.stderr)
+            for alternative in alternatives:
+                start(alternative)
+            pending += len(alternatives)
+            hedged = True
+            continue
+        pending -= 1
+        if resolved:
+            if link != links[0]:
+                print(f"[DEBUG] Risolto con la variante alternativa {link}", file=sys.stderr)
+            return resolved
+        if not hedged:
+            # La principale ha fallito subito: niente attesa, parte subito il resto
+            for alternative in alternatives:
+                start(alternative)
+            pending += len(alternatives)
+            hedged = True
+    return None
+
+def lookup_channel(input_arg, return_original_link=False, catalog=None, hedge=None):
+    """
+    Risolve un nome di canale o un link Vavoo. Restituisce (codice, output).
+    Il nome viene cercato nell'indice di vavoo_cache.json; il catalogo viene scaricato
+    solo se la cache manca o non contiene il canale. catalog permette di passarne uno già pronto.
+    hedge=False disattiva l'hedging (usato dal batch, che ha già il suo pool limitato).
+    """
     # Controlla se l'input è un link Vavoo diretto
     if "vavoo.to" in input_arg and "/play/" in input_arg:
         print(f"[DEBUG] Direct Vavoo link detected: {input_arg}", file=sys.stderr)
         resolved = resolve_direct_link(input_arg)
         if resolved:
-            print(resolved)  # Output per il caller
-            sys.exit(0)
-        else:
-            print("[DEBUG] Failed to resolve direct link", file=sys.stderr)
-            print("RESOLVE_FAIL", file=sys.stderr)
-            sys.exit(4)
-    
+            return 0, resolved
+        print("[DEBUG] Failed to resolve direct link", file=sys.stderr)
+        return EXIT_RESOLVE_FAIL, None
+
     # Altrimenti tratta come nome di canale
     wanted = normalize_vavoo_name(input_arg)
     print(f"[DEBUG] Looking for channel: {wanted}", file=sys.stderr)
-    
+
     try:
-        channels = get_channels()
-        print(f"[DEBUG] Found {len(channels)} total channels", file=sys.stderr)
-        
-        found = None
-        # Prima prova matching esatto
-        for ch in channels:
-            chname = normalize_vavoo_name(ch.get('name', ''))
-            if chname == wanted:
-                found = ch
-                print(f"[DEBUG] Found exact match: {ch.get('name')}", file=sys.stderr)
-                break
-        
-        # Se non trova matching esatto, prova matching parziale/fuzzy
-        if not found:
-            for ch in channels:
-                original_name = ch.get('name', '').strip().upper()
-                # Rimuovi suffissi comuni come .a, .b, .c, HD, etc.
-                clean_name = re.sub(r'\s+\.[a-zA-Z]$', '', original_name)
-                clean_name = re.sub(r'\s+(HD|FHD|4K)$', '', clean_name)
-                
-                # Controlla se il nome pulito contiene il nome cercato o viceversa
-                if wanted in clean_name or clean_name in wanted:
-                    found = ch
-                    print(f"[DEBUG] Found partial match: {ch.get('name')} (cleaned: {clean_name})", file=sys.stderr)
-                    break
-        
-        # Se ancora non trova, prova una ricerca ancora più flessibile
-        if not found:
-            for ch in channels:
-                original_name = ch.get('name', '').strip().upper()
-                # Rimuovi spazi e caratteri speciali per matching più flessibile
-                name_simple = re.sub(r'[^A-Z0-9]', '', original_name)
-                wanted_simple = re.sub(r'[^A-Z0-9]', '', wanted)
-                
-                if wanted_simple in name_simple or name_simple in wanted_simple:
-                    found = ch
-                    print(f"[DEBUG] Found flexible match: {ch.get('name')} (simplified: {name_simple})", file=sys.stderr)
-                    break
-        
+        shared_catalog = catalog is not None
+        if catalog is None:
+            catalog = load_catalog()
+        found = search_channel_index(catalog["index"], wanted) if catalog else None
+        if not found and not shared_catalog and (catalog is None or catalog["source"] == "cache"):
+            print("[DEBUG] Canale non presente in cache, scarico il catalogo", file=sys.stderr)
+            catalog = catalog_from_channels(get_channels())
+            found = search_channel_index(catalog["index"], wanted)
+
+        links = catalog["links"]
+        print(f"[DEBUG] Found {len(links)} total channels ({catalog['source']})", file=sys.stderr)
         if not found:
-            print(f"[DEBUG] Channel '{wanted}' not found in {len(channels)} channels", file=sys.stderr)
+            print(f"[DEBUG] Channel '{wanted}' not found in {len(links)} channels", file=sys.stderr)
             # Debug: mostra alcuni nomi di canali per aiutare
-            sample_names = [normalize_vavoo_name(ch.get('name', '')) for ch in channels[:10]]
+            sample_names = [normalize_vavoo_name(name) for name in list(links)[:10]]
             print(f"[DEBUG] Sample channel names: {sample_names}", file=sys.stderr)
-            print("NOT_FOUND", file=sys.stderr)
-            sys.exit(2)
-            
-        url = found.get('url')
-        if not url:
+            return EXIT_NOT_FOUND, None
+
+        # Varianti (.c, .s, .b, ...) ordinate per latenza misurata: la più veloce e sana per prima
+        urls = [links[name] for name in rank_variants(found) if links.get(name)]
+        if not urls:
             print("[DEBUG] No URL found for channel", file=sys.stderr)
-            print("NO_URL", file=sys.stderr)
-            sys.exit(3)
-            
-        print(f"[DEBUG] Found Vavoo URL: {url}", file=sys.stderr)
-        
+            return EXIT_NO_URL, None
+
+        print(f"[DEBUG] Found Vavoo URL: {urls[0]} ({len(urls)} varianti)", file=sys.stderr)
+
         # Se richiesto, restituisci solo il link originale Vavoo
         if return_original_link:
-            print(url)  # Restituisce il link Vavoo originale non risolto
-            sys.exit(0)
-        
-        # Altrimenti risolvi il link
-        print(f"[DEBUG] Resolving URL: {url}", file=sys.stderr)
-        resolved = resolve_vavoo_link(url)
+            return 0, urls[0]
+
+        # Altrimenti risolvi il link; se la variante migliore tarda o fallisce entrano in gioco le altre
+        print(f"[DEBUG] Resolving URL: {urls[0]}", file=sys.stderr)
+        resolved = hedged_resolve(urls, enabled=hedge)
         if resolved:
-            print(resolved)  # Questo è l'output che viene letto
-            sys.exit(0)
-        else:
-            print("[DEBUG] Failed to resolve URL", file=sys.stderr)
-            print("RESOLVE_FAIL", file=sys.stderr)
-            sys.exit(4)
-            
+            return 0, resolved
+        print("[DEBUG] Failed to resolve URL", file=sys.stderr)
+        return EXIT_RESOLVE_FAIL, None
+
     except Exception as e:
         print(f"[DEBUG] Exception: {str(e)}", file=sys.stderr)
-        print("ERROR", file=sys.stderr)
-        sys.exit(5) 
+        return EXIT_ERROR, None
+
+def add_channel_aliases(ch):
+    # Aggiungi alias ai canali per un miglior matching
+    if "name" in ch:
+        ch["aliases"] = [
+            ch["name"].replace(" HD", "").replace(" FHD", "").replace(" 4K", ""),  # Versione senza qualità
+            re.sub(r'\.[a-zA-Z]$', '', ch["name"]),  # Senza suffisso .a, .b, ecc
+        ]
+    return ch
+
+def dump_channels():
+    channels = get_channels()
+    for ch in channels:
+        add_channel_aliases(ch)
+    return json.dumps(channels)
+
+def iter_channel_lines():
+    """Un canale JSON per riga, emesso appena arriva la pagina del catalogo che lo contiene"""
+    for _group, items in iter_catalog_pages():
+        for ch in items:
+            yield json.dumps(add_channel_aliases(ch))
+
+def diff_links(old_links, new_links):
+    """Canali aggiunti, rimossi e con link cambiato rispetto alla cache precedente"""
+    return {
+        "added": sorted(name for name in new_links if name not in old_links),
+        "removed": sorted(name for name in old_links if name not in new_links),
+        "changed": sorted(name for name in new_links if name in old_links and old_links[name] != new_links[name]),
+    }
+
+def build_cache_file():
+    """
+    Ricostruisce vavoo_cache.json in modo incrementale: confronta il nuovo catalogo con la cache
+    esistente, registra le differenze e riscrive il file (atomicamente) solo se qualcosa è cambiato.
+    """
+    channels = get_channels()
+    if not channels:
+        return "Catalogo Vavoo vuoto o non raggiungibile: cache esistente mantenuta"
+    cache = build_vavoo_cache(channels)
+
+    previous = read_json_file(VAVOO_CACHE_FILE) or {}
+    changes = diff_links(previous.get("links", {}), cache)
+    summary = f"+{len(changes['added'])} -{len(changes['removed'])} ~{len(changes['changed'])}"
+    index = build_channel_index(cache)
+    if previous.get("links") and previous.get("index") == index and not any(changes.values()):
+        return f"Cache Vavoo invariata ({len(cache)} canali), nessuna scrittura"
+
+    now_ms = int(time.time() * 1000)
+    changes["timestamp"] = now_ms
+    data = {
+        "timestamp": now_ms,
+        "links": cache,
+        "index": index,
+        "changes": changes,
+    }
+    write_json_atomic(VAVOO_CACHE_FILE, data, indent=2)
+    for kind in ("added", "removed", "changed"):
+        if changes[kind]:
+            print(f"[DEBUG] Canali {kind}: {changes[kind]}", file=sys.stderr)
+    return f"Cache Vavoo generata con successo! ({len(cache)} canali, {summary})"
+
+BATCH_WORKERS = int(os.environ.get("VAVOO_BATCH_WORKERS", "8"))
+
+def resolve_batch(items, return_original_link=False, workers=BATCH_WORKERS, emit=None):
+    """
+    Risolve molti canali (nomi o link /play/) in parallelo con un pool limitato.
+    Signature e sessione HTTP sono condivise; il catalogo (dalla cache su disco, altrimenti
+    scaricato una sola volta) serve solo se tra gli input ci sono nomi di canale.
+    emit(result) viene chiamata appena ogni elemento è completato, nell'ordine di completamento.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    items = [item.strip() for item in items if item and item.strip()]
+    direct = [item for item in items if "vavoo.to" in item and "/play/" in item]
+    catalog = None
+    if len(direct) < len(items):
+        catalog = load_catalog() or catalog_from_channels(get_channels())
+    # I link /play/ vengono sempre risolti, i nomi solo senza --original-link: in quel caso
+    # la signature si ottiene qui, una volta, invece che da ogni worker con la cache vuota
+    if direct or (items and not return_original_link):
+        getAuthSignature()
+
+    def run(item):
+        # Niente hedging: i thread extra sfuggirebbero al limite di workers
+        code, output = lookup_channel(item, return_original_link, catalog, hedge=False)
+        result = {"input": item, "code": code, "status": "OK" if code == 0 else STATUS_NAMES.get(code, "ERROR")}
+        if code == 0:
+            result["url"] = output
+        return result
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(run, item) for item in items]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if emit:
+                emit(result)
+    return results
+
+# Pre-warm: tiene in cache i link risolti dei canali più visti
+TV_CHANNELS_FILE = os.path.join(os.path.dirname(__file__), 'config/tv_channels.json')
+PREWARM_LIMIT = int(os.environ.get("VAVOO_PREWARM_LIMIT", "50"))
+PREWARM_WORKERS = int(os.environ.get("VAVOO_PREWARM_WORKERS", "4"))
+PREWARM_INTERVAL = int(os.environ.get("VAVOO_PREWARM_INTERVAL", "0"))
+
+def prewarm_priority(hits_file=None, limit=PREWARM_LIMIT):
+    """
+    Link /play/ da tenere caldi, in ordine di priorità: prima i più richiesti secondo il file
+    dei contatori (di default quelli registrati nella cache dei link risolti), poi i canali
+    di config/tv_channels.json nell'ordine del file.
+    """
+    if hits_file:
+        hits = read_json_file(hits_file) or {}
+    else:
+        hits = (read_json_file(RESOLVED_CACHE_FILE) or {}).get("hits", {})
+    catalog = load_catalog()
+
+    def to_link(key):
+        if "/play/" in key:
+            return key
+        if not catalog:
+            return None
+        variants = search_channel_index(catalog["index"], normalize_vavoo_name(key))
+        return catalog["links"].get(rank_variants(variants)[0]) if variants else None
+
+    candidates = [key for key, _ in sorted(hits.items(), key=lambda kv: -kv[1])]
+    for channel in read_json_file(TV_CHANNELS_FILE) or []:
+        candidates.extend(channel.get("vavooNames") or [])
+
+    links = []
+    for key in candidates:
+        link = to_link(key)
+        if link and link not in links:
+            links.append(link)
+        if len(links) >= limit:
+            break
+    return links
+
+def prewarm_link(link, min_remaining=0):
+    """Risolve il link solo se in cache manca o scade entro min_remaining secondi"""
+    with _resolved_lock:
+        entry = _resolved_cache.get(link)
+    if entry and entry["fresh_until"] - time.time() > min_remaining:
+        return "fresh"
+    url = fetch_resolved_link(link)
+    if not url:
+        return "failed"
+    _store_resolved(link, url)
+    return "warmed"
+
+def prewarm(hits_file=None, limit=PREWARM_LIMIT, workers=PREWARM_WORKERS, min_remaining=0):
+    from concurrent.futures import ThreadPoolExecutor
+
+    _load_resolved_cache()
+    links = prewarm_priority(hits_file, limit)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(lambda link: prewarm_link(link, min_remaining), links))
+    summary = {status: results.count(status) for status in ("warmed", "fresh", "failed")}
+    summary["total"] = len(links)
+    return summary
+
+def prewarm_loop(interval, hits_file=None, limit=PREWARM_LIMIT, workers=PREWARM_WORKERS):
+    """Ripete il pre-warm ogni interval secondi; rinnova i link che scadrebbero prima del giro successivo"""
+    while True:
+        try:
+            summary = prewarm(hits_file, limit, workers, min_remaining=interval)
+            print(f"[DEBUG] Pre-warm completato: {summary}", file=sys.stderr)
+        except Exception as e:
+            print(f"[DEBUG] Errore nel pre-warm: {e}", file=sys.stderr)
+        time.sleep(interval)
+
+def _option(argv, flag, default=None, cast=str):
+    """Valore dell'opzione flag in argv (es. --limit 20), altrimenti default"""
+    if flag in argv:
+        i = argv.index(flag)
+        if i + 1 < len(argv):
+            return cast(argv[i + 1])
+    return default
+
+def _batch_args(argv):
+    """Estrae da argv gli elementi posizionali e l'eventuale --workers N"""
+    items = []
+    workers = BATCH_WORKERS
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "--workers" and i + 1 < len(argv):
+            workers = int(argv[i + 1])
+            i += 2
+            continue
+        if not arg.startswith("--"):
+            items.append(arg)
+        i += 1
+    return items, workers
+
+def handle(argv):
+    """Esegue un comando (stessa sintassi della riga di comando). Restituisce (codice, output)"""
+    # Esegui con: python3 vavoo_resolver.py --build-cache
+    if "--build-cache" in argv:
+        return 0, build_cache_file()
+
+    if not argv:
+        return EXIT_USAGE, USAGE
+
+    if "--cache-stats" in argv:
+        return 0, json.dumps(resolved_cache_stats())
+
+    # Controllo se l'opzione per dump dei canali è presente
+    if "--dump-channels" in argv:
+        if "--ndjson" in argv:
+            return 0, "\n".join(iter_channel_lines())
+        return 0, dump_channels()
+
+    # Misura le varianti dei canali indicati (o di tutti quelli in tv_channels.json)
+    if "--probe" in argv:
+        names = [arg for arg in argv if not arg.startswith("--")]
+        if not names:
+            names = [n for ch in (read_json_file(TV_CHANNELS_FILE) or []) for n in (ch.get("vavooNames") or [])]
+        return 0, json.dumps(probe_channels(names), ensure_ascii=False)
+
+    # Candidati fuzzy con punteggio, per verificare come viene interpretato un nome
+    if "--match" in argv:
+        catalog = load_catalog() or catalog_from_channels(get_channels())
+        wanted = normalize_vavoo_name(_option(argv, "--match", ""))
+        candidates = fuzzy_candidates(catalog["index"], wanted, limit=10, min_score=0, require_overlap=False)
+        return 0, json.dumps([
+            {"name": c, "variants": v, "score": sc, "accepted": sc >= FUZZY_MIN_SCORE and names_overlap(wanted, c)}
+            for c, v, sc in candidates
+        ], ensure_ascii=False)
+
+    # Controllo di regressione del matching sulla cache distribuita (codice 1 se qualcosa non torna)
+    if "--check-matching" in argv:
+        errors = check_matching()
+        return (EXIT_USAGE if errors else 0), "\n".join(errors) or f"Matching OK ({len(MATCHING_CHECKS)} nomi controllati)"
+
+    if "--prewarm" in argv:
+        summary = prewarm(
+            _option(argv, "--hits"),
+            _option(argv, "--limit", PREWARM_LIMIT, int),
+            _option(argv, "--workers", PREWARM_WORKERS, int),
+        )
+        return 0, json.dumps(summary)
+
+    # Batch: canali passati come argomenti (in modalità --serve), output NDJSON
+    if "--batch" in argv:
+        items, workers = _batch_args(argv)
+        results = resolve_batch(items, "--original-link" in argv, workers)
+        return 0, "\n".join(json.dumps(r, ensure_ascii=False) for r in results)
+
+    return lookup_channel(argv[0], "--original-link" in argv)
+
+def serve():
+    """
+    Modalità server: legge richieste JSON (una per riga) da stdin e risponde su stdout.
+    Richiesta:  {"id": 1, "argv": ["RAI 1", "--original-link"]}
+    Risposta:   {"id": 1, "ok": true, "code": 0, "output": "https://..."}
+    Il processo resta attivo, quindi import, sessione HTTP e connessioni TLS vengono riusati.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    out = sys.stdout
+    # Qualsiasi print accidentale su stdout finisce su stderr e non rompe il protocollo
+    sys.stdout = sys.stderr
+    write_lock = threading.Lock()
+
+    def respond(message):
+        with write_lock:
+            out.write(json.dumps(message, ensure_ascii=False) + "\n")
+            out.flush()
+
+    def run(request):
+        req_id = request.get("id")
+        try:
+            code, output = handle(list(request.get("argv") or []))
+            message = {"id": req_id, "ok": code == 0, "code": code, "output": output}
+            if code != 0:
+                message["error"] = STATUS_NAMES.get(code, output)
+            respond(message)
+        except Exception as e:
+            respond({"id": req_id, "ok": False, "code": EXIT_ERROR, "error": str(e)})
+
+    # Con VAVOO_PREWARM_INTERVAL > 0 il server tiene caldi i canali più visti in background
+    if PREWARM_INTERVAL > 0:
+        threading.Thread(target=prewarm_loop, args=(PREWARM_INTERVAL,), daemon=True).start()
+
+    workers = int(os.environ.get("SIDECAR_WORKERS", "8"))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                respond({"id": None, "ok": False, "code": EXIT_USAGE, "error": f"Richiesta non valida: {e}"})
+                continue
+            pool.submit(run, request)
+
+def main():
+    handle_profile_startup(get_session)
+
+    if "--serve" in sys.argv:
+        serve()
+        sys.exit(0)
+
+    # Pre-warm periodico: python3 vavoo_resolver.py --prewarm --interval 120
+    if "--prewarm" in sys.argv and "--interval" in sys.argv:
+        argv = sys.argv[1:]
+        prewarm_loop(
+            _option(argv, "--interval", PREWARM_INTERVAL, int),
+            _option(argv, "--hits"),
+            _option(argv, "--limit", PREWARM_LIMIT, int),
+            _option(argv, "--workers", PREWARM_WORKERS, int),
+        )
+
+    # Dump in streaming: ogni riga viene scritta (e letta dal chiamante) senza attendere l'intero catalogo
+    if "--dump-channels" in sys.argv and "--ndjson" in sys.argv:
+        for line in iter_channel_lines():
+            print(line, flush=True)
+        sys.exit(0)
+
+    # Batch da stdin: una riga per canale, un risultato NDJSON per riga appena pronto
+    if "--batch" in sys.argv:
+        items, workers = _batch_args(sys.argv[1:])
+        if not items:
+            items = sys.stdin.read().splitlines()
+
+        def emit(result):
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+
+        resolve_batch(items, "--original-link" in sys.argv, workers, emit)
+        sys.exit(0)
+
+    code, output = handle(sys.argv[1:])
+    if code == 0:
+        print(output)  # Questo è l'output che viene letto
+    elif code == EXIT_USAGE:
+        print(output, file=sys.stderr)
+    else:
+        print(STATUS_NAMES[code], file=sys.stderr)
+    sys.exit(code)
+
+if __name__ == "__main__":
+    main()